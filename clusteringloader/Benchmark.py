@@ -0,0 +1,298 @@
+import gzip
+import json
+import time
+import resource
+from ResultFileIndex import *
+
+
+class Benchmark:
+    """
+    Measure the throughput of each stage of the load pipeline and the peak memory (RSS).
+
+    Stages:
+        scan: list the result files directory (files/s).
+        validate: index and validate the result files (files/s).
+        resolve: load the resolver (if enabled) and resolve every result file line (lines/s).
+        write: generate the insert file(s) (lines/s).
+        copy: COPY the insert file(s) into 'clusters', rolled back (rows/s). PostgreSQL only.
+
+    The results can be saved as a baseline JSON and compared with a previous baseline.
+
+    """
+
+    stages = ['scan', 'validate', 'resolve', 'write', 'copy']
+
+    def __init__(self, loader=None, parameters=None, tolerance=0.1):
+
+        # ClusteringLoader to be measured.
+        self.loader = loader
+
+        # Dataset parameters, saved with the results (results are only comparable for the same dataset).
+        self.parameters = parameters or {}
+
+        # Relative change (throughput or memory) reported as a regression.
+        self.tolerance = tolerance
+
+        # Stage name -> result (dict).
+        self.results = {}
+
+    def peak_rss(self):
+        """
+        Return the peak resident memory of this process and of its (finished) children.
+
+        Returns:
+            (tuple): Peak RSS (KB) of this process and of the biggest child process.
+
+        """
+
+        return (
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    def measure(self, stage=None, function=None, unit=None):
+        """
+        Run a stage and record its time, throughput and peak memory.
+
+        Args:
+            stage(str): Stage name.
+            function(function): Runs the stage and returns how many items (files, lines, rows) it processed.
+            unit(str): Items unit.
+
+        Returns:
+            (dict): Stage result.
+
+        """
+
+        self.loader.log.info('-- START -- :clusteringloader:benchmark:' + stage)
+
+        start = time.time()
+
+        items = function()
+
+        seconds = time.time() - start
+
+        rss, children_rss = self.peak_rss()
+
+        result = {
+            'seconds': seconds,
+            'items': items,
+            'unit': unit,
+            'throughput': items / seconds if seconds > 0 else None,
+            'peak_rss_kb': rss,
+            'children_peak_rss_kb': children_rss}
+
+        self.results[stage] = result
+
+        self.loader.log.info('-- DONE -- :clusteringloader:benchmark:' + stage + ': ' + str(items) + ' ' + unit + ' in ' + str(round(seconds, 3)) + 's.')
+
+        return result
+
+    def scan(self):
+        """
+        List the result files directory.
+
+        Returns:
+            (int): Total of result files.
+
+        """
+
+        index = ResultFileIndex(self.loader.source_data)
+
+        return len(list(index.directory_entries()))
+
+    def validate(self):
+        """
+        Index and validate all the result files (again: the loader index is reset).
+
+        Returns:
+            (int): Total of result files.
+
+        """
+
+        self.loader.file_index = None
+
+        self.loader.check_files_consistency()
+
+        return len(self.loader.valid_files) + len(self.loader.invalid_files)
+
+    def resolve(self):
+        """
+        Resolve the proteins of every valid result file, one call per file like the insert
+        file generation: from the resolver (loaded again) if it's enabled, otherwise by
+        batched database queries.
+
+        Returns:
+            (int): Total of lines.
+
+        """
+
+        self.loader.resolver = None
+
+        # Same condition of the insert file generation.
+        if self.loader.preload_proteins or self.loader.resolver_snapshot or self.loader.workers > 1:
+            self.loader.preload_resolver()
+
+        lines = 0
+
+        for file_to_read in self.loader.valid_files:
+
+            with open(file_to_read, 'rb') as f:
+                contents = f.read()
+
+            lines += len(self.loader.resolve_protein_ids(self.loader.result_file_lines(contents)))
+
+        return lines
+
+    def write(self):
+        """
+        Generate the insert file(s) from scratch.
+
+        Returns:
+            (int): Total of result file lines.
+
+        """
+
+        self.loader.resume = False
+
+        self.loader.generate_insert_file()
+
+        return self.loader.result_file_index().total_lines()
+
+    def copy(self):
+        """
+        COPY the insert file(s) into the 'clusters' table and roll it back.
+
+        Returns:
+            (int): Total of rows.
+
+        """
+
+        columns = 'id, identification, ec_id, protein_id, clustering_method_id'
+
+        cursor = self.loader.session.connection().connection.cursor()
+
+        rows = 0
+
+        try:
+            for insert_file in self.loader.insert_manifest().insert_files:
+
+                if self.loader.compress:
+                    source = gzip.open(insert_file, 'rb')
+                else:
+                    source = open(insert_file, 'rb')
+
+                try:
+                    cursor.copy_expert('COPY clusters(' + columns + ') FROM STDIN' + self.loader.copy_options(), source)
+                finally:
+                    source.close()
+
+                rows += cursor.rowcount
+
+        finally:
+            cursor.close()
+
+            # Measure only: nothing is kept in the database.
+            self.loader.session.rollback()
+
+        return rows
+
+    def run(self, stages=None):
+        """
+        Run the stages (COPY is skipped if the database isn't PostgreSQL).
+
+        Args:
+            stages(list): Stage names (default: all).
+
+        Returns:
+            (dict): Stage name -> result.
+
+        """
+
+        units = {'scan': 'files', 'validate': 'files', 'resolve': 'lines', 'write': 'lines', 'copy': 'rows'}
+
+        for stage in stages or self.stages:
+
+            if stage == 'copy' and self.loader.session.bind.dialect.name != 'postgresql':
+                self.loader.log.info('Benchmark: COPY skipped (not a PostgreSQL database).')
+                continue
+
+            self.measure(stage, getattr(self, stage), units[stage])
+
+        return self.results
+
+    def report(self):
+        """
+        Return the benchmark results.
+
+        Returns:
+            (dict): Dataset parameters, stage results and peak memory.
+
+        """
+
+        rss, children_rss = self.peak_rss()
+
+        return {
+            'parameters': self.parameters,
+            'stages': self.results,
+            'peak_rss_kb': rss,
+            'children_peak_rss_kb': children_rss}
+
+    def save(self, file_path=None):
+        """
+        Save the results as a baseline JSON file.
+
+        Args:
+            file_path(str): Baseline file path.
+
+        """
+
+        with open(file_path, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+    def compare(self, file_path=None):
+        """
+        Compare the results with a baseline JSON file.
+
+        Args:
+            file_path(str): Baseline file path.
+
+        Returns:
+            (list): One dict per stage in both results: stage, baseline and current throughput
+                and peak RSS, relative changes and if it's a regression.
+
+        """
+
+        with open(file_path) as f:
+            baseline = json.load(f)
+
+        if baseline.get('parameters') != self.parameters:
+            self.loader.log.info('Benchmark: baseline was measured with another dataset: ' + str(baseline.get('parameters')))
+
+        comparison = []
+
+        for stage in self.stages:
+
+            if stage not in self.results or stage not in baseline.get('stages', {}):
+                continue
+
+            before = baseline['stages'][stage]
+            after = self.results[stage]
+
+            throughput_change = None
+
+            if before['throughput'] and after['throughput']:
+                throughput_change = after['throughput'] / before['throughput'] - 1
+
+            rss_change = float(after['peak_rss_kb']) / before['peak_rss_kb'] - 1
+
+            comparison.append({
+                'stage': stage,
+                'baseline_throughput': before['throughput'],
+                'throughput': after['throughput'],
+                'throughput_change': throughput_change,
+                'baseline_peak_rss_kb': before['peak_rss_kb'],
+                'peak_rss_kb': after['peak_rss_kb'],
+                'rss_change': rss_change,
+                'regression': (throughput_change is not None and throughput_change < -self.tolerance) or rss_change > self.tolerance})
+
+        return comparison
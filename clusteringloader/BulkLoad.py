@@ -0,0 +1,217 @@
+import os
+import json
+from sqlalchemy import text
+
+
+class BulkLoad:
+    """
+    Prepare a table to receive millions of rows and put it back to normal afterwards.
+
+    Before the load, the secondary indexes and the constraints (except the primary key)
+    are recorded and dropped. After the load (successful or not) they are all created
+    again, the foreign keys are validated and the table is analyzed.
+
+    The definitions are also saved to a JSON file, so they can be restored even if the
+    loader process dies in the middle of the load.
+
+    """
+
+    def __init__(self, session=None, table='clusters', definitions_file=None, maintenance_work_mem='1GB', parallel_workers=8):
+
+        self.session = session
+        self.table = table
+        self.definitions_file = definitions_file
+        self.maintenance_work_mem = maintenance_work_mem
+
+        # Parallel workers for each index build (PostgreSQL 11+).
+        self.parallel_workers = parallel_workers
+
+        # (name, definition) of the dropped indexes.
+        self.indexes = []
+
+        # (name, definition, type) of the dropped constraints.
+        self.constraints = []
+
+    def session_settings(self):
+        """
+        Return the settings for the sessions that load the data.
+
+        Returns:
+            (dict): Setting name -> value.
+
+        """
+
+        return {
+            'synchronous_commit': 'off',
+            'maintenance_work_mem': self.maintenance_work_mem}
+
+    def record(self):
+        """
+        Record the secondary indexes and the constraints (except the primary key) of the table.
+
+        """
+
+        # Indexes that belong to constraints (unique) go away with its constraints.
+        result = self.session.execute(text(
+            'SELECT quote_ident(n.nspname) || \'.\' || quote_ident(i.relname), pg_get_indexdef(i.oid) '
+            'FROM pg_index x '
+            'JOIN pg_class i ON i.oid = x.indexrelid '
+            'JOIN pg_namespace n ON n.oid = i.relnamespace '
+            'WHERE x.indrelid = CAST(:table AS regclass) '
+            'AND NOT x.indisprimary '
+            'AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid) '
+            'ORDER BY i.relname'),
+            {'table': self.table})
+
+        self.indexes = [(name, definition) for name, definition in result]
+
+        result = self.session.execute(text(
+            'SELECT quote_ident(conname), pg_get_constraintdef(oid), contype '
+            'FROM pg_constraint '
+            'WHERE conrelid = CAST(:table AS regclass) '
+            'AND contype <> \'p\' '
+            'ORDER BY conname'),
+            {'table': self.table})
+
+        self.constraints = [(name, definition, kind) for name, definition, kind in result]
+
+    def save(self):
+        """
+        Save the recorded definitions to the definitions file.
+
+        """
+
+        if not self.definitions_file:
+            return
+
+        with open(self.definitions_file, 'w') as f:
+            json.dump({
+                'table': self.table,
+                'indexes': self.indexes,
+                'constraints': self.constraints}, f)
+
+    def load(self):
+        """
+        Read the definitions saved by a previous (interrupted) bulk load.
+
+        Returns:
+            (boolean): True if there were saved definitions.
+
+        """
+
+        if not self.definitions_file or not os.path.exists(self.definitions_file):
+            return False
+
+        with open(self.definitions_file) as f:
+            saved = json.load(f)
+
+        self.table = saved['table']
+        self.indexes = [tuple(index) for index in saved['indexes']]
+        self.constraints = [tuple(constraint) for constraint in saved['constraints']]
+
+        return True
+
+    def prepare(self):
+        """
+        Record and drop the secondary indexes and constraints of the table.
+
+        """
+
+        self.record()
+        self.save()
+
+        for name, definition, kind in self.constraints:
+            self.session.execute(text('ALTER TABLE ' + self.table + ' DROP CONSTRAINT ' + name))
+
+        for name, definition in self.indexes:
+            self.session.execute(text('DROP INDEX ' + name))
+
+        self.session.commit()
+
+    def exists(self, name=None, constraint=False):
+        """
+        Check if an index or a constraint of the table exists.
+
+        Args:
+            name(str): Index (schema qualified) or constraint name, quoted if needed.
+            constraint(boolean): True for a constraint, False for an index.
+
+        Returns:
+            (boolean): True or False.
+
+        """
+
+        if constraint:
+            result = self.session.execute(text(
+                'SELECT count(*) FROM pg_constraint '
+                'WHERE conrelid = CAST(:table AS regclass) AND quote_ident(conname) = :name'),
+                {'table': self.table, 'name': name})
+
+            return result.scalar() > 0
+
+        result = self.session.execute(text('SELECT to_regclass(:name)'), {'name': name})
+
+        return result.scalar() is not None
+
+    def restore(self):
+        """
+        Create again every recorded index and constraint that doesn't exist, validate the foreign keys and analyze the table.
+
+        Returns:
+            (list): Constraints that could not be validated.
+
+        """
+
+        self.session.rollback()
+
+        server_version = int(self.session.execute(text('SHOW server_version_num')).scalar())
+
+        self.session.execute(text('SET maintenance_work_mem = \'' + self.maintenance_work_mem + '\''))
+
+        # PostgreSQL 11+ builds a single index using parallel workers.
+        if server_version >= 110000:
+            self.session.execute(text('SET max_parallel_maintenance_workers = ' + str(int(self.parallel_workers))))
+
+        for name, definition in self.indexes:
+            if not self.exists(name):
+                self.session.execute(text(definition))
+
+        self.session.commit()
+
+        not_validated = []
+
+        for name, definition, kind in self.constraints:
+
+            if self.exists(name, constraint=True):
+                continue
+
+            # Constraints that were never validated are created the same way again.
+            if definition.endswith(' NOT VALID'):
+                self.session.execute(text('ALTER TABLE ' + self.table + ' ADD CONSTRAINT ' + name + ' ' + definition))
+                self.session.commit()
+
+                continue
+
+            # Unique constraints can't be NOT VALID: they're built like an index.
+            if kind in ('f', 'c'):
+                self.session.execute(text('ALTER TABLE ' + self.table + ' ADD CONSTRAINT ' + name + ' ' + definition + ' NOT VALID'))
+                self.session.commit()
+
+                try:
+                    self.session.execute(text('ALTER TABLE ' + self.table + ' VALIDATE CONSTRAINT ' + name))
+                    self.session.commit()
+                except Exception:
+                    self.session.rollback()
+                    not_validated.append(name)
+
+            else:
+                self.session.execute(text('ALTER TABLE ' + self.table + ' ADD CONSTRAINT ' + name + ' ' + definition))
+                self.session.commit()
+
+        self.session.execute(text('ANALYZE ' + self.table))
+        self.session.commit()
+
+        if self.definitions_file and os.path.exists(self.definitions_file):
+            os.remove(self.definitions_file)
+
+        return not_validated
@@ -0,0 +1,136 @@
+from sqlalchemy import text
+
+
+class ClusterSummaries:
+    """
+    Keep the 'cluster_summaries' table: members and organisms of every cluster
+    (clustering_method_id, ec_id, identification).
+
+    The table is created and seeded from the whole 'clusters' table only once. After that,
+    each load updates it set-based from the rows it just loaded (a range of cluster ids):
+
+    - append: the clusters are new (new identifications), so their summaries are inserted.
+    - replace (and partitions): the summaries of the clustering method are deleted first.
+    - merge: a new member may join a cluster already loaded, so its members are added and
+      its organism counted only if no other member of the cluster has it.
+
+    """
+
+    # Any constant, only used to serialize the table creation between loaders.
+    lock_key = 4242002
+
+    def __init__(self, session=None, table='clusters'):
+
+        self.session = session
+        self.table = table
+
+    def initialize(self):
+        """
+        Create and seed the summaries table if it doesn't exist yet.
+
+        Returns:
+            (boolean): True if it was created now (the seed already has every loaded row).
+
+        """
+
+        self.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': self.lock_key})
+
+        if self.session.execute(text("SELECT to_regclass('cluster_summaries')")).scalar():
+            self.session.commit()
+
+            return False
+
+        # Same column types as the clusters table.
+        self.session.execute(text(
+            'CREATE TABLE cluster_summaries AS '
+            'SELECT c.clustering_method_id, c.ec_id, c.identification, '
+            'count(*) AS members, '
+            'count(DISTINCT p.organism_id) AS organisms '
+            'FROM ' + self.table + ' c '
+            'LEFT JOIN proteins p ON p.id = c.protein_id '
+            'WHERE c.clustering_method_id IS NOT NULL '
+            'AND c.ec_id IS NOT NULL '
+            'AND c.identification IS NOT NULL '
+            'GROUP BY c.clustering_method_id, c.ec_id, c.identification'))
+
+        self.session.execute(text(
+            'ALTER TABLE cluster_summaries ADD PRIMARY KEY (clustering_method_id, ec_id, identification)'))
+
+        self.session.execute(text('ANALYZE cluster_summaries'))
+
+        self.session.commit()
+
+        return True
+
+    def update(self, clustering_method_id=None, first_id=None, last_id=None, mode='append'):
+        """
+        Update the summaries of the clusters of the loaded rows (single transaction).
+
+        Args:
+            clustering_method_id(int): Clustering method database id.
+            first_id(int): First cluster id of the loaded rows.
+            last_id(int): Last cluster id of the loaded rows.
+            mode(str): 'append', 'replace' or 'merge' (see the class description).
+
+        Returns:
+            (int): Total of summaries inserted or updated (None if the table was just created).
+
+        """
+
+        if self.initialize():
+            return None
+
+        parameters = {
+            'clustering_method_id': clustering_method_id,
+            'first_id': first_id,
+            'last_id': last_id}
+
+        # Organisms of the new members only (the same organism may already be in the cluster).
+        organisms = 'count(DISTINCT l.organism_id)'
+
+        if mode == 'merge':
+            organisms = (
+                'count(DISTINCT CASE WHEN NOT EXISTS ('
+                'SELECT 1 FROM ' + self.table + ' o '
+                'JOIN proteins op ON op.id = o.protein_id '
+                'WHERE o.clustering_method_id = l.clustering_method_id '
+                'AND o.ec_id = l.ec_id '
+                'AND o.identification = l.identification '
+                'AND op.organism_id = l.organism_id '
+                'AND o.id NOT BETWEEN :first_id AND :last_id) '
+                'THEN l.organism_id END)')
+
+        try:
+            if mode == 'replace':
+                self.session.execute(text(
+                    'DELETE FROM cluster_summaries WHERE clustering_method_id = :clustering_method_id'),
+                    parameters)
+
+            # Only the loaded rows are read (primary key range).
+            result = self.session.execute(text(
+                'WITH loaded AS ('
+                'SELECT c.clustering_method_id, c.ec_id, c.identification, p.organism_id '
+                'FROM ' + self.table + ' c '
+                'LEFT JOIN proteins p ON p.id = c.protein_id '
+                'WHERE c.id BETWEEN :first_id AND :last_id '
+                'AND c.clustering_method_id = :clustering_method_id '
+                'AND c.ec_id IS NOT NULL '
+                'AND c.identification IS NOT NULL) '
+                'INSERT INTO cluster_summaries (clustering_method_id, ec_id, identification, members, organisms) '
+                'SELECT l.clustering_method_id, l.ec_id, l.identification, count(*), ' + organisms + ' '
+                'FROM loaded l '
+                'GROUP BY l.clustering_method_id, l.ec_id, l.identification '
+                'ON CONFLICT (clustering_method_id, ec_id, identification) DO UPDATE SET '
+                'members = cluster_summaries.members + excluded.members, '
+                'organisms = cluster_summaries.organisms + excluded.organisms'),
+                parameters)
+
+            updated = result.rowcount
+
+            self.session.commit()
+
+        except Exception:
+            self.session.rollback()
+            raise
+
+        return updated
@@ -0,0 +1,229 @@
+import os
+import re
+import time
+from ClusteringLoader import *
+
+
+class ClusteringBatch:
+    """
+    Load several clustering results (labels) one after the other in a single process.
+
+    Every label gets its own loader (its own 'clustering_methods' row, insert files, index
+    and metrics files), but they all share what doesn't depend on the label:
+
+    - the database session (and the connection pool of its engine);
+    - the proteins and EC numbers resolver, preloaded only once;
+    - the cluster ids: the allocator (--reserve-ids) or the last id and identification
+      used by the previous label, so 'clusters' is queried for max(id) only once.
+
+    """
+
+    def __init__(self, results=None, options=None):
+
+        # (source data directory, metadata file) of each label, in loading order.
+        self.results = results or []
+
+        # ClusteringLoader parameters of every label (except source_data and metadata_file).
+        self.options = dict(options or {})
+
+        # One resolver for all the labels: always preloaded.
+        self.options['preload_proteins'] = True
+
+        self.loaders = []
+
+        # Summary of each label (see run).
+        self.summaries = []
+
+    def label_name(self, label=None):
+        """
+        Return the label as a file name.
+
+        Args:
+            label(str): Clustering method label.
+
+        Returns:
+            (str): File name.
+
+        """
+
+        return re.sub('[^A-Za-z0-9._-]', '_', str(label))
+
+    def label_path(self, file_path=None, label=None):
+        """
+        Return the file path of a label: the label name goes before the extension.
+
+        Args:
+            file_path(str): File path given for the batch (None for no file).
+            label(str): Clustering method label.
+
+        Returns:
+            (str): File path or None.
+
+        """
+
+        if not file_path:
+            return file_path
+
+        root, extension = os.path.splitext(file_path)
+
+        return root + '.' + self.label_name(label) + extension
+
+    def create_loaders(self):
+        """
+        Create the loader of every label (nothing is read from the database yet).
+
+        Returns:
+            (list): ClusteringLoader of each label.
+
+        """
+
+        if self.loaders:
+            return self.loaders
+
+        labels = set()
+
+        for source_data, metadata_file in self.results:
+
+            options = dict(self.options)
+            options['source_data'] = source_data
+            options['metadata_file'] = metadata_file
+
+            loader = ClusteringLoader(**options)
+
+            if loader.label in labels:
+                raise ValueError('Label: ' + str(loader.label) + ' (' + str(metadata_file) + ') is loaded twice by the batch.')
+
+            labels.add(loader.label)
+
+            # Insert files of each label in its own directory.
+            if loader.insert_files_directory:
+                loader.insert_files_directory = os.path.join(loader.insert_files_directory, self.label_name(loader.label))
+
+                if not os.path.exists(loader.insert_files_directory):
+                    os.makedirs(loader.insert_files_directory)
+
+            loader.index_file = self.label_path(loader.index_file, loader.label)
+            loader.metrics.metrics_file = self.label_path(loader.metrics.metrics_file, loader.label)
+
+            self.loaders.append(loader)
+
+        return self.loaders
+
+    def share(self, loader=None, previous=None):
+        """
+        Give a loader the session, resolver and cluster ids of the previous one.
+
+        Args:
+            loader(ClusteringLoader): Loader of the next label.
+            previous(ClusteringLoader): Loader of the label just processed.
+
+        """
+
+        loader.session = previous.session
+        loader.resolver = previous.resolver
+        loader.id_allocator = previous.id_allocator
+
+        # Values after the ones used by the previous label (None: max(...) is queried).
+        loader.last_cluster_primary_key = previous.last_cluster_primary_key
+        loader.last_cluster_identification = previous.last_cluster_identification
+
+    def rollback(self, loader=None):
+        """
+        Roll back the session of a failed label. If even that fails (lost connection), it's
+        logged: the pool gives the next label another connection.
+
+        Args:
+            loader(ClusteringLoader): Loader of the failed label.
+
+        """
+
+        try:
+            loader.session.rollback()
+
+        except Exception:
+            loader.log.exception('-- ERROR -- :clusteringloader:batch: rollback of: ' + str(loader.label))
+
+    def clustering_method_id(self, loader=None):
+        """
+        Return the clustering method id of a label (for its summary).
+
+        Args:
+            loader(ClusteringLoader): Loader of the label.
+
+        Returns:
+            (int): Clustering method database id or None (not created or the database is unreachable).
+
+        """
+
+        try:
+            clustering_method = loader.clustering_method_exists(loader.label)
+
+        except Exception:
+            self.rollback(loader)
+
+            return None
+
+        return clustering_method.id if clustering_method else None
+
+    def run(self, process=None):
+        """
+        Process every label. A failed label is logged and rolled back, the others go on.
+
+        Args:
+            process(function): Called with the loader of each label (generate and/or load).
+
+        Returns:
+            (list): Summary (dict) of each label: label, clustering method id, source data,
+                valid and invalid files, rows, seconds and error (None if it succeeded).
+
+        """
+
+        loaders = self.create_loaders()
+
+        previous = None
+
+        for loader in loaders:
+
+            if previous:
+                self.share(loader, previous)
+
+            loader.log.info('-- START -- :clusteringloader:batch: ' + str(loader.label))
+
+            start = time.time()
+            error = None
+
+            try:
+                process(loader)
+
+            except Exception as e:
+                error = str(e) or e.__class__.__name__
+
+                loader.log.exception('-- ERROR -- :clusteringloader:batch: ' + str(loader.label))
+
+                self.rollback(loader)
+
+            clustering_method_id = self.clustering_method_id(loader)
+
+            summary = {
+                'label': loader.label,
+                'clustering_method_id': clustering_method_id,
+                'source_data': loader.source_data,
+                'valid_files': loader.total_valid_files(),
+                'invalid_files': loader.total_invalid_files(),
+                'rows': loader.metrics.counters['rows'],
+                'seconds': time.time() - start,
+                'error': error}
+
+            self.summaries.append(summary)
+
+            loader.log.info(
+                'Label: ' + str(loader.label) + ' (clustering method: ' + str(clustering_method_id) + '): ' +
+                str(summary['valid_files']) + ' valid files, ' + str(summary['invalid_files']) + ' invalid files, ' +
+                str(summary['rows']) + ' rows, ' + ('%.1f' % summary['seconds']) + ' seconds' +
+                (', failed: ' + error if error else '') + '.')
+
+            loader.log.info('-- DONE -- :clusteringloader:batch: ' + str(loader.label))
+
+            previous = loader
+
+        return self.summaries
@@ -3,482 +3,328 @@ import sys
 import pprint
 import datetime
 import re
-import glob
 import subprocess
+import shutil
+import gzip
+import threading
+import multiprocessing
 from sqlalchemy.sql import func
+from sqlalchemy import text
+from sqlalchemy.engine.url import make_url
 import logging
-import logging.handlers
 from Ec import *
 from ClusteringMethod import *
 from Cluster import *
 from Connection import *
-
-class ClusteringLoader:
-    """
-    Deals with clustering results loading into relational database.
-
-    This class is heavly attached to the relational database.
-
-    There's no meaning for this class without a relational database connection.
-
+from ProteinResolver import *
+from CopyStream import *
+from IdAllocator import *
+from InsertManifest import *
+from ClusteringResults import *
+from LogSystem import *
+from BulkLoad import *
+from BinaryCopyWriter import *
+from InsertFile import *
+from ResolverSnapshot import *
+from LoadMetrics import *
+from ResultFilePrefetcher import *
+from RowBlockFormatter import *
+from StagedLoad import *
+from PartitionLoad import *
+from ClusterSummaries import *
+
+# The loader used by the process pool workers (inherited through fork).
+_worker_loader = None
+
+
+def generate_ec_insert_part(task=None):
     """
+    Generate the insert file part for a single EC number. Runs inside a process pool worker.
 
-    def __init__(
-            self,
-            source_data=None,
-            metadata_file=None,
-            insert_files_directory=None,
-            database=None,
-            password=None,
-            host=None,
-            user=None,
-            log_file=None):
-
-        # Metadata about the clustering results
-        # Theese values will be overridden by the metadata file loading.
-        self.label = None
-        self.date = None 
-        self.author = None 
-        self.software = None 
-        self.source_data = None 
-
-        # Where are the clustering results
-        self.source_data = source_data
-
-        # Logging
-        self.log_file = log_file
-
-        # Destination for the database insert instructions file.
-        self.insert_files_directory = insert_files_directory 
-
-        # To store what files are ok or not to be loaded into relational database. 
-        self.valid_files = []
-        self.invalid_files = []
-
-        # Just for report... don't really need that.
-        self.ecs_with_single_cluster = None
-        self.ecs_with_two_clusters = None
-        self.ecs_with_more_than_two_clusters = None
-
-        # For relational database data control.
-        self.current_cluster_primary_key = 0
-        self.last_cluster_primary_key = None
-        self.last_cluster_identification = None
-
-        # Database connection parameters.
-        self.user = user
-        self.password = password
-        self.host = host 
-        self.database = database 
-
-        # This project expect to load millions of records into the relational database.
-        # No way to run it without making sure everything can be tracked by a log file.
-        self.create_log_system(self.log_file)
-
-        if metadata_file:
-            self.generate_metadata_from_file(metadata_file)
-
-        # -------------------------------------------------------------------------------- #
-        # Database session. We need one.                                                   #
-        # -------------------------------------------------------------------------------- #
-        # ---- IF YOU WANT TO REFACTOR THIS CLASS TO REMOVE DEPENDENCY, YOU ONLY HAVE ---- #
-        # ---- TO PROVIDE A VALID SQLAlchemy Session and attach to the self.session   ---- #
-        # -------------------------------------------------------------------------------- #
-        self.session = None
-        # -------------------------------------------------------------------------------- #
-
-        c = Connection()
-        self.session = c.connect(
-            user=self.user,
-            password=self.password,
-            host=self.host,
-            database=self.database)
-
-
-    def create_log_system(self, log_file=None):
-        """
-        Set all logger parameters (file log path, for example), output format and set the class p
-
-        Log the process is extremely important because we don't know how long it will take.
-
-        """
-
-        log = logging.getLogger('')
-        log.setLevel(logging.DEBUG)
-        format = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-
-        ch = logging.StreamHandler(sys.stdout)
-        ch.setFormatter(format)
-        log.addHandler(ch)
-
-        fh = logging.handlers.RotatingFileHandler( log_file , maxBytes=0, backupCount=0)
-        fh.setFormatter(format)
-        log.addHandler(fh)
-
-        self.log = log 
-
-    def result_files(self):
-        """
-        Get the list of cluster result files.
-
-        Returns:
-            (list): List of cluster result file paths.
-
-        """
-
-        files = []
-
-        files = glob.glob(self.source_data + '/*.fasta_*')
-
-        return files
-
-    def check_files_consistency(self):
-        """
-        Run through the result files and check if each one is a valid file.
-
-        Also creates a list of valid files and a list of invalid files.
-
-        """
-
-        files = self.result_files()
-
-        for my_result_file in files:
-
-            if self.is_valid_result_file(my_result_file):
-                self.valid_files.append(my_result_file)
-            else:
-                self.invalid_files.append(my_result_file)
-
-    def is_valid_result_file(self, file_path=None):
-        """
-        Test if the cluster result file is valid (content format).
-
-        Args:
-            file_path(str): Full path for a file to be tested.
-
-        Returns:
-            (boolean): True or False.
-
-        """
-
-        # --------------------------------------------------------- #
-        # There's a lot of ways for testing files consistency...    #
-        # The problem here is to not expect too much from the file. #
-        # Maybe test if organism code doesn't have more than 3 or 4 #
-        # chars is a good idea... but think better: you won't come  #
-        # back to this code if everything is running ok for... like #
-        # 4 years. And suppose KEGG change the way of coding        #
-        # organisms, but keep the idea of separating code from      #
-        # protein using ':' char.                                   #
-        # Worse, you are importing a different database with a      #
-        # different way of coding proteins.                         #
-        # You got it: this method exists here only because it's an  #
-        # crucial step for the importer, but it have to be more     #
-        # elaborated. At this momment is not possible to say        #
-        # this method is actual implemented/done.                   #
-        # But... at least it test something.                        #
-        # --------------------------------------------------------- #
-
-        errors = 0
-        f = open(file_path)
-
-        # We're going to test only the first 2 lines (totaly arbitrary number).
-        counter = 1
-
-        total_of_lines = 0
-
-        for line in f:
-            line = line.rstrip('\r\n')
-
-            total_of_lines += 1
-
-            expected_records = line.split(':')
-
-            if len(expected_records) != 2:
-                errors += 1
-
-            counter += 1
+    The cluster ids and identifications were already assigned, so the result is exactly
+    the same as the serial generation.
 
-            if counter == 2:
-                counter = 1
-                f.close()
-                break
+    Args:
+        task(dict): EC number, its ids, the files to process and the part file to write.
 
-        f.close()
+    Returns:
+        (dict): Task index, total of written rows (per file too) and the resolver hits/misses.
 
-        if total_of_lines == 0:
-            errors += 1
-
-        if errors > 0:
-            return False
-        else:
-            return True
-
-    def get_valid_result_files(self):
-        """
-        Return the list of valid (content format) cluster result files.
-
-        Returns:
-            (list): List of valid cluster file paths.
-        """
-
-        return self.valid_files
-
-
-    def generate_metadata_from_file(self, metadata_file=None):
-        """
-        Generate the class metadata from the results metadata file.
-
-        Args:
-            metadata_file(str): Full path for the clustering metadata file.
-
-        """
-
-        result_metadata = {}
-
-        # Too busy and lazy to write an smarter approach.
-        with open(metadata_file) as f:
-
-            for line in f:
-                line = line.rstrip('\r\n')
-
-                records = line.split('=')
-
-                if len(line) > 1:
-                    field = re.sub(' ', '', records[0])
-
-                    value = re.sub('^ ', '', records[1])
-                    value = re.sub(' $', '', value)
+    """
 
-                    result_metadata[field] = value
+    loader = _worker_loader
 
-        self.author = result_metadata['author']
-        self.label = result_metadata['label']
-        self.date = result_metadata['date']
-        self.software = result_metadata['software']
+    hits = loader.resolver.hits
+    misses = loader.resolver.misses
 
-    def total_valid_files(self):
-        """
-        Return the total of valid cluster result files.
+    rows = 0
+    file_rows = []
 
-        Returns:
-            (int): Total of valid files.
+    # Written to a temporary file: an existing part is always complete.
+    file_destination = loader.open_insert_file(task['part_file'] + '.tmp', 'wb')
 
-        """
+    prefetcher = ResultFilePrefetcher(
+        [task_file[0] for task_file in task['files']],
+        loader.prefetch_threads,
+        loader.prefetch_files)
 
-        return len(self.valid_files)
+    # Checked once, not per file.
+    log_files = loader.log.isEnabledFor(logging.DEBUG)
 
-    def total_invalid_files(self):
-        """
-        Return the total of invalid cluster result files.
+    try:
+        for position, contents in enumerate(prefetcher):
 
-        Returns:
-            (int): Total of invalid files.
+            file_to_read, cluster_identification, cluster_id, total_of_lines = task['files'][position]
 
-        """
+            if log_files:
+                loader.log.debug('Processing file: %s', file_to_read)
 
-        return len(self.invalid_files)
+            file_rows.append(loader.write_insert_block(
+                file_destination,
+                cluster_id,
+                cluster_identification,
+                task['ec_id'],
+                loader.resolve_protein_ids(loader.result_file_lines(contents)),
+                task['clustering_method_id']))
 
-    def ec_number_from_file_name(self, file_path=None):
-        """
-        Return the EC number from the cluster result file name.
+            rows += file_rows[-1]
 
-        Return:
-            (str): EC number.
+            if log_files:
+                loader.log.debug('Done Processing file: %s (%d lines, %d rows).', file_to_read, total_of_lines, file_rows[-1])
 
-        """
+    finally:
+        prefetcher.close()
+        file_destination.close()
 
-        file_name = os.path.basename(file_path)
+    os.rename(task['part_file'] + '.tmp', task['part_file'])
 
-        # EC_4.2.1.51.fasta_2
+    return {
+        'index': task['index'],
+        'rows': rows,
+        'file_rows': file_rows,
+        'hits': loader.resolver.hits - hits,
+        'misses': loader.resolver.misses - misses}
 
-        ec_number = re.search('^EC_(.*)\.fasta_.*', file_name)
 
-        ec_number = str(ec_number.group(1))
+class ClusteringLoader(ClusteringResults):
+    """
+    Deals with clustering results loading into relational database.
 
-        return ec_number
+    This class is heavly attached to the relational database.
 
-    def ec_numbers(self):
-        """
-        Return the total of EC numbers found in the cluster result files.
+    There's no meaning for this class without a relational database connection.
 
-        Returns:
-            (int): Total of EC numbers.
+    """
 
-        """
+    def __init__(
+            self,
+            source_data=None,
+            metadata_file=None,
+            insert_files_directory=None,
+            database=None,
+            password=None,
+            host=None,
+            user=None,
+            log_file=None,
+            preload_proteins=False,
+            workers=1,
+            reserve_ids=False,
+            resume=False,
+            index_file=None,
+            strict_validation=False,
+            shards=1,
+            bulk_load=False,
+            maintenance_work_mem='1GB',
+            insert_format='text',
+            compress=False,
+            compress_level=6,
+            session=None,
+            resolver_snapshot=None,
+            metrics_file=None,
+            metrics_interval=60,
+            log_level='info',
+            log_every_files=1000,
+            prefetch_threads=4,
+            prefetch_files=64,
+            use_numpy=True,
+            mode='append',
+            port=5432,
+            sslmode=None,
+            socket=None,
+            dsn=None,
+            pool_size=5,
+            summaries=True):
+
+        # Metadata, result files (index and validation) and logging: no database needed.
+        ClusteringResults.__init__(
+            self,
+            source_data=source_data,
+            metadata_file=metadata_file,
+            index_file=index_file,
+            strict_validation=strict_validation,
+            workers=workers,
+            log_file=log_file,
+            log_level=log_level)
 
-        ec_numbers = []
+        # Per result file messages are 'debug': at 'info' only every 'log_every_files' files is logged.
+        self.log_every_files = log_every_files
 
-        files = self.result_files()
+        # Destination for the database insert instructions file.
+        self.insert_files_directory = insert_files_directory 
 
-        for result_file in files:
-            ec_number = self.ec_number_from_file_name(result_file)
+        # Split the insert file into shards, loaded at the same time by different connections.
+        self.shards = shards
 
-            ec_numbers.append(ec_number)
+        # Drop the 'clusters' indexes and constraints during the load, build them again afterwards.
+        self.bulk_load = bulk_load
+        self.maintenance_work_mem = maintenance_work_mem
 
-        return ec_numbers
+        # Settings (name -> value) for the sessions that load the data.
+        self.load_session_settings = {}
 
-    def total_ec_numbers(self):
-        """
-        Return the total of EC numbers found in the cluster result files.
+        # What to do with the rows of a label that's already loaded: 'append' (add them again),
+        # 'replace' (swap all its rows) or 'merge' (add only the missing memberships).
+        self.mode = mode
 
-        Returns:
-            (int): Total of EC numbers.
+        # Table the rows are copied into ('clusters', the staging table of replace/merge or the
+        # new partition) and the statement that creates it inside the COPY transaction (FREEZE).
+        self.load_table = 'clusters'
+        self.load_table_statement = None
 
-        """
+        # Update 'cluster_summaries' (members and organisms of each cluster) from the cluster
+        # ids of the rows just loaded (first, last).
+        self.summaries = summaries
+        self.loaded_ids = None
 
-        return len(self.ec_numbers())
+        # Insert file format: 'text' (tab separated) or 'binary' (PostgreSQL binary COPY).
+        self.insert_format = insert_format
+        self.binary_writer = None
 
-    def total_sequences(self):
-        """
-        Return the total of sequences found in all cluster result files.
+        # The rows of each result file are formatted as one block (NumPy, if installed and enabled).
+        self.use_numpy = use_numpy
+        self.block_formatter = None
 
-        Returns:
-            (int): Total of sequences.
+        # Gzip compressed insert file(s), decompressed on the fly into psql while loading.
+        self.compress = compress
+        self.compress_level = compress_level
 
-        """
+        # For relational database data control.
+        self.current_cluster_primary_key = 0
+        self.last_cluster_primary_key = None
+        self.last_cluster_identification = None
 
-        total_of_sequences = 0
+        # Database connection parameters.
+        self.user = user
+        self.password = password
+        self.host = host 
+        self.database = database 
+        self.port = port
+        self.sslmode = sslmode
 
-        self.check_files_consistency()
+        # Unix domain socket directory (instead of host and port).
+        self.socket = socket
 
-        files = self.valid_files
+        # Full database URL: overrides the parameters above for the database session.
+        self.dsn = dsn
 
-        for result_file in files:
+        # Connections kept by the (process wide) pool of the database engine.
+        self.pool_size = pool_size
 
-            with open(result_file) as f:
+        # Resolve proteins and EC numbers ids from memory instead of one query per record.
+        self.preload_proteins = preload_proteins
+        self.resolver = None
 
-                for line in f:
-                    total_of_sequences += 1
+        # Snapshot file of the resolver data, reused while 'proteins' and 'ecs' don't change.
+        self.resolver_snapshot = resolver_snapshot
 
-        return total_of_sequences
+        # Threads reading the next result files ahead (0 means no prefetch) and how many
+        # files can be read ahead (memory cap).
+        self.prefetch_threads = prefetch_threads
+        self.prefetch_files = prefetch_files
 
-    def cluster_identification_from_file(self, file_path=None):
-        """
-        Get the cluster identification form a result file.
+        # Reserve blocks of ids in the database (safe for concurrent loaders) instead of SELECT max(...).
+        # The allocator is created when it's first used (see __getattr__).
+        self.reserve_ids = reserve_ids
 
-        Normally it's only a single integer.
+        # Skip the result files already processed by a previous (crashed) generation.
+        self.resume = resume
 
-        Args:
-            file_path(str): File path or only file name.
+        # Counters, stage times, progress and ETA (snapshot written to the metrics file, if any).
+        self.metrics = LoadMetrics(self.log, metrics_file, metrics_interval)
 
-        Returns:
-            (str): Cluster identification from result file.
+        # -------------------------------------------------------------------------------- #
+        # Database session. We need one.                                                   #
+        # -------------------------------------------------------------------------------- #
+        # ---- IF YOU WANT TO REFACTOR THIS CLASS TO REMOVE DEPENDENCY, YOU ONLY HAVE ---- #
+        # ---- TO PROVIDE A VALID SQLAlchemy Session and attach to the self.session   ---- #
+        # -------------------------------------------------------------------------------- #
+        # Without a session, it connects when the session is first used (see __getattr__):
+        # reading and checking the result files never connects.
+        if session:
+            self.session = session
+        # -------------------------------------------------------------------------------- #
 
+    def __getattr__(self, name=None):
         """
+        Create the database session and the ids allocator when they're first used.
 
-        file_name = os.path.basename(file_path)
-
-        cluster_id = re.search('^EC_.*\.fasta_(.*)', file_name)
-        cluster_id = cluster_id.group(1)
-
-        return cluster_id
-
-    def total_clusters(self):
         """
-        Return the total of clusters generated from all the clustering process.
-
-        Returns:
-            (int): Total of clusters.
 
-        """
+        if name == 'session':
+            self.session = self.connect_database()
 
-        clusters = []
+            return self.session
 
-        self.check_files_consistency()
+        if name == 'id_allocator':
+            self.id_allocator = None
 
-        files = self.valid_files
+            if self.reserve_ids:
+                self.id_allocator = IdAllocator(self.session.get_bind())
 
-        for result in files:
-            clusters.append(self.cluster_identification_from_file(result))
+            return self.id_allocator
 
-        return len(clusters)
+        raise AttributeError(name)
 
-    def generate_ecs_clusters_stats(self):
+    def connect_database(self):
         """
-        Generate the statistics for EC numbers and its clusters.
+        Connect to the relational database.
 
         Returns:
-            (dict): EC numbers and its clusters statistics.
+            (Session): SQLAlchemy session.
 
         """
 
-        self.check_files_consistency()
-
-        ecs_with_single_cluster = []
-        ecs_with_two_clusters = []
-        ecs_with_more_than_two_clusters = []
-
-        ecs_and_clusters = {}
-
-        files = self.valid_files
-
-        for result in files:
-            ec_number = self.ec_number_from_file_name(result)
-
-            if ec_number not in ecs_and_clusters:
-                ecs_and_clusters[ec_number] = []
-
-            cluster_identification = self.cluster_identification_from_file(
-                result)
-
-            ecs_and_clusters[ec_number].append(cluster_identification)
-
-        for ec, total_clusters in ecs_and_clusters.iteritems():
-
-            total_clusters = total_clusters[0]
-
-            if int(total_clusters) == 1:
-                ecs_with_single_cluster.append(ec)
+        c = Connection(pool_size=self.pool_size)
 
-            if int(total_clusters) == 2:
-                ecs_with_two_clusters.append(ec)
+        return c.connect(dsn=self.database_url())
 
-            if int(total_clusters) > 2:
-                ecs_with_more_than_two_clusters.append(ec)
-
-        self.ecs_with_single_cluster = ecs_with_single_cluster
-        self.ecs_with_two_clusters = ecs_with_two_clusters
-        self.ecs_with_more_than_two_clusters = ecs_with_more_than_two_clusters
-
-        return {
-            'single': ecs_with_single_cluster,
-            'two': ecs_with_two_clusters,
-            'more': ecs_with_more_than_two_clusters}
-
-    # TODO: test
-    def ecs_and_its_clusters(self):
+    def database_url(self):
         """
-        Return the EC numbers and its clusters from flat/raw cluster result files.
+        Return the database URL: the DSN or the one built from the connection parameters.
 
         Returns:
-            (dict): EC numbers and its cluster numbers.
+            (str): Database URL (or URL object).
 
         """
 
-        ecs_and_clusters = {}
-
-        self.check_files_consistency()
-
-        files = self.valid_files
-
-        for result in files:
-
-            ec_number = self.ec_number_from_file_name(result)
+        if self.dsn:
+            url = make_url(self.dsn)
 
-            if ec_number not in ecs_and_clusters:
-                ecs_and_clusters[ec_number] = []
+            # The user is only used if the URL has no user name.
+            if not url.username and self.user:
+                url.username = self.user
 
-            cluster_identification = self.cluster_identification_from_file(
-                result)
+            return url
 
-            ecs_and_clusters[ec_number].append(cluster_identification)
-
-            # Remove duplicates
-            ecs_and_clusters[ec_number] = set(ecs_and_clusters[ec_number])
-            ecs_and_clusters[ec_number] = list(ecs_and_clusters[ec_number])
+        return Connection().url(
+            user=self.user,
+            password=self.password,
+            host=self.host,
+            database=self.database,
+            port=self.port,
+            sslmode=self.sslmode,
+            socket=self.socket)
 
-        return ecs_and_clusters
 
     # TODO: test, comments
     #      This method exists only for the testings.
@@ -560,7 +406,7 @@ class ClusteringLoader:
 
         """
 
-        if not self.last_cluster_identification:
+        if self.last_cluster_identification is None:
 
             # Solve querying database.
             result_db = self.session.query(func.max(Cluster.identification))
@@ -586,7 +432,7 @@ class ClusteringLoader:
 
         """
 
-        if not self.last_cluster_identification:
+        if self.last_cluster_identification is None:
             current = self.get_last_cluster_identification()
         else:
             current = self.last_cluster_identification
@@ -608,7 +454,7 @@ class ClusteringLoader:
 
         """
 
-        if not self.last_cluster_primary_key:
+        if self.last_cluster_primary_key is None:
 
             # Solve querying database.
             result_db = self.session.query(func.max(Cluster.id))
@@ -634,7 +480,7 @@ class ClusteringLoader:
 
         """
 
-        if not self.last_cluster_primary_key:
+        if self.last_cluster_primary_key is None:
             current = self.get_last_cluster_id()
         else:
             current = self.last_cluster_primary_key
@@ -657,12 +503,74 @@ class ClusteringLoader:
 
         """
 
-        result = self.session.query(Protein).filter_by(
+        if self.resolver:
+            return self.resolver.protein_id(str(protein_identification))
+
+        self.metrics.add('db_round_trips')
+
+        # Just the id: no ORM object is built.
+        result = self.session.query(Protein.id).filter_by(
             identification=str(protein_identification)).first()
 
         if result:
             return result.id
 
+    def resolve_protein_ids(self, protein_identifications=None, batch_size=1000):
+        """
+        Return the relational database ids (table 'proteins') of many protein identifications at once.
+
+        Without the resolver, it's one query per batch instead of one per identification.
+
+        Args:
+            protein_identifications(list): Protein identifications in the relational database.
+            batch_size(int): Identifications per query.
+
+        Returns:
+            (list): Protein database ids (None if not found), same order.
+
+        """
+
+        if self.resolver:
+            return self.resolver.resolve_protein_ids(protein_identifications)
+
+        found = {}
+
+        unique = list(set(protein_identifications))
+
+        for start in range(0, len(unique), batch_size):
+
+            self.metrics.add('db_round_trips')
+
+            query = self.session.query(Protein.identification, Protein.id).filter(
+                Protein.identification.in_(unique[start:start + batch_size])).order_by(Protein.id)
+
+            for identification, protein_id in query:
+                if identification not in found:
+                    found[identification] = protein_id
+
+        return [found.get(identification) for identification in protein_identifications]
+
+    def result_file_lines(self, contents=None):
+        """
+        Split the contents of a result file into lower case protein identifications.
+
+        Same lines as iterating over the file (the last line may have no line break).
+
+        Args:
+            contents(str): Result file contents.
+
+        Returns:
+            (list): Protein identifications.
+
+        """
+
+        lines = contents.split(b'\n')
+
+        if lines[-1] == b'':
+            lines.pop()
+
+        return [line.rstrip(b'\r').lower() for line in lines]
+
     def ec_number_id(self, ec_number=None):
         """
         Return the relational database id (table 'ecs') related to the EC number queried.
@@ -675,23 +583,24 @@ class ClusteringLoader:
 
         """
 
-        result = self.session.query(Ec).filter_by(ec=str(ec_number)).first()
+        if self.resolver:
+            return self.resolver.ec_number_id(str(ec_number))
+
+        self.metrics.add('db_round_trips')
+
+        result = self.session.query(Ec.id).filter_by(ec=str(ec_number)).first()
 
         if result:
             return result.id
 
-    def generate_insert_file(self):
+    def prepare_clustering_method(self):
         """
-        Generate the clusters insert files to be loaded into the relational database.
+        Create the clustering method (label) into the relational database if it doesn't exist yet.
 
-        """
+        Returns:
+            (int): Clustering method database id.
 
-        self.log.info('-- START -- :clusteringloader:generate_insert_files')
-        self.log.info('Author: ' + str(self.author) + '.')
-        self.log.info('Label: ' + str(self.label) + '.')
-        self.log.info('Date: ' + str(self.date) + '.')
-        self.log.info('Database: ' + str(self.database) + '.')
-        self.log.info('Source: ' + str(self.source_data) + '.')
+        """
 
         self.log.info('Checking if clustering label already exists.')
 
@@ -709,25 +618,130 @@ class ClusteringLoader:
         else:
             self.log.info('Clustering label: ' + str(self.label) + ' already exists. Using it.') 
 
+            if self.mode == 'append':
+                self.log.info('Mode: append. Its rows already loaded are kept: loading the same results again duplicates them.')
 
-        # Pick the clustering method id (from relational database) to be used in this whole results loading.
-        clustering_method_id = self.clustering_method_id_from_name(self.label)
+        return self.clustering_method_id_from_name(self.label)
 
-        self.log.info('Checking files consistency.')
+    def preload_resolver(self):
+        """
+        Load all proteins and EC numbers ids into memory, so no query is needed per record.
 
-        self.check_files_consistency()
+        """
 
-        self.log.info('Done Checking files consistency.')
+        self.log.info('-- START -- :clusteringloader:preload_resolver')
 
-        file_name_destination = self.insert_files_directory + '/' + 'clustersInsert.psql'
+        snapshot = None
 
-        self.log.info('Insert file will be stored at: ' + str(file_name_destination))
+        if self.resolver_snapshot:
+            snapshot = ResolverSnapshot(self.resolver_snapshot)
+            fingerprint = snapshot.fingerprint(self.session)
 
-        if os.path.exists(file_name_destination):
+        if snapshot and snapshot.matches(fingerprint):
+            self.log.info('Resolver snapshot: ' + str(self.resolver_snapshot) + ' is up to date. Using it.')
 
-            self.log.info('Insert file: ' + str(file_name_destination) + ' already exists. Removing it to create a new one.')
+            resolver = snapshot.open()
 
-            os.remove(file_name_destination)
+        else:
+            resolver = ProteinResolver()
+            resolver.preload(self.session)
+
+            if snapshot:
+                self.log.info('Resolver snapshot: ' + str(self.resolver_snapshot) + ' is missing or out of date. Saving it.')
+
+                snapshot.save(resolver, fingerprint)
+
+        self.resolver = resolver
+
+        stats = resolver.statistics()
+
+        self.log.info('Resolver loaded: ' + str(stats['proteins']) + ' proteins and ' + str(stats['ecs']) + ' EC numbers.')
+        self.log.info('Resolver memory footprint: ' + str(stats['memory_bytes']) + ' bytes.')
+
+        self.log.info('-- DONE -- :clusteringloader:preload_resolver')
+
+    def log_resolver_statistics(self):
+        """
+        Log the resolver hits and misses (if the resolver is being used).
+
+        """
+
+        if not self.resolver:
+            return
+
+        stats = self.resolver.statistics()
+
+        self.log.info('Resolver memory footprint: ' + str(stats['memory_bytes']) + ' bytes.')
+        self.log.info('Resolver proteins hits: ' + str(stats['hits']) + ', misses: ' + str(stats['misses']) + '.')
+        self.log.info('Resolver EC numbers hits: ' + str(stats['ec_hits']) + ', misses: ' + str(stats['ec_misses']) + '.')
+
+    def generate_insert_file(self):
+        """
+        Generate the clusters insert files to be loaded into the relational database.
+
+        """
+
+        self.log.info('-- START -- :clusteringloader:generate_insert_files')
+        self.log.info('Author: ' + str(self.author) + '.')
+        self.log.info('Label: ' + str(self.label) + '.')
+        self.log.info('Date: ' + str(self.date) + '.')
+        self.log.info('Database: ' + str(self.database) + '.')
+        self.log.info('Source: ' + str(self.source_data) + '.')
+
+        # Pick the clustering method id (from relational database) to be used in this whole results loading.
+        clustering_method_id = self.prepare_clustering_method()
+
+        self.log.info('Checking files consistency.')
+
+        self.metrics.start_stage('validate')
+
+        self.check_files_consistency()
+
+        self.metrics.finish_stage()
+
+        self.log.info('Done Checking files consistency.')
+
+        # The manifest has to be generated with the same parameters to be resumed.
+        manifest = self.insert_manifest()
+
+        file_name_destination = manifest.insert_file
+
+        self.log.info('Insert file will be stored at: ' + str(file_name_destination))
+
+        if self.insert_format == 'binary' and not self.binary_writer:
+            self.binary_writer = BinaryCopyWriter(self.clusters_column_types())
+
+            self.log.info('Insert file format: binary (' + ', '.join(self.binary_writer.column_types) + ').')
+
+        self.block_formatter = RowBlockFormatter(self.binary_writer, self.use_numpy)
+
+        self.log.info('Rows block formatting: ' + ('NumPy' if self.block_formatter.numpy else 'Python') + '.')
+
+        parameters = {
+            'label': self.label,
+            'source_data': self.source_data,
+            'clustering_method_id': clustering_method_id,
+            'parallel': self.workers > 1,
+            'shards': self.shards,
+            'format': self.insert_format,
+            'compress': self.compress}
+
+        resumed = self.resume and manifest.resume(parameters)
+
+        if resumed and manifest.finished:
+            self.log.info('Insert file: ' + str(file_name_destination) + ' was already generated. Nothing to do.')
+
+            self.log.info('-- DONE -- :clusteringloader:generate_insert_files')
+
+            return
+
+        for insert_file in manifest.insert_files:
+
+            if os.path.exists(insert_file):
+
+                self.log.info('Insert file: ' + str(insert_file) + ' already exists. Removing it to create a new one.')
+
+                os.remove(insert_file)
 
 
         self.log.info('Will process: ' + str(len(self.valid_files)) + ' files.')
@@ -736,180 +750,1639 @@ class ClusteringLoader:
 
         ecs_and_its_clusters = self.ecs_and_its_clusters()
 
-        with open(file_name_destination, 'a') as file_destination:
+        # Workers can't share the database session: they always resolve from memory.
+        if (self.preload_proteins or self.resolver_snapshot or self.workers > 1) and not self.resolver:
+            self.metrics.start_stage('preload')
+
+            self.preload_resolver()
+
+            self.metrics.finish_stage()
+
+        if resumed:
+            self.log.info('Resuming: ' + str(len(manifest.entries)) + ' files were already processed.')
+
+            # Same ids of the interrupted generation.
+            self.last_cluster_primary_key = manifest.header['first_id']
+            self.last_cluster_identification = manifest.header['first_identification']
+
+        else:
+            if self.id_allocator:
+                self.reserve_cluster_ids(*self.count_cluster_ids(ecs_and_its_clusters))
+
+            self.last_cluster_primary_key = self.get_last_cluster_id()
+            self.last_cluster_identification = self.get_last_cluster_identification()
+
+            header = dict(parameters)
+            header['first_id'] = self.last_cluster_primary_key
+            header['first_identification'] = self.last_cluster_identification
+
+            manifest.start(header)
+
+        self.metrics.start_stage('generate', self.result_file_index().total_size())
 
-            for ec, clusters in ecs_and_its_clusters.iteritems():
+        if self.workers > 1:
+            self.generate_insert_file_parallel(
+                manifest,
+                ecs_and_its_clusters,
+                clustering_method_id,
+                resumed)
 
-                self.log.info('Processing EC number: ' + str(ec) + '.')
-                self.log.info('EC number: ' + str(ec) + ' has: ' + str(len(clusters)) + ' clusters.')
+            self.metrics.set('bytes_written', self.insert_files_size(manifest))
+            self.metrics.finish_stage()
 
-                ec_id = self.ec_number_id(str(ec))
+            self.log_resolver_statistics()
 
-                for cluster in clusters:
-                    # Remount the source cluster file name in order to read the
-                    # file results.
-                    file_to_read = self.source_data + '/EC_' + \
-                        str(ec) + '.fasta_' + str(cluster)
+            self.log.info('-- DONE -- :clusteringloader:generate_insert_files')
 
-                    self.log.info('Processing file: ' + str(file_to_read)) 
+            return
 
-                    with open(file_to_read) as f:
+        processed_files = manifest.processed_files()
 
-                        cluster_identification = self.generate_cluster_next_identification()
+        # Keep going from the last processed file.
+        if manifest.entries:
+            self.last_cluster_primary_key = manifest.entries[-1]['last_id']
+            self.last_cluster_identification = manifest.entries[-1]['identification']
 
-                        for line in f:
-                            line = line.rstrip('\r\n')
-                            line = line.lower()
+        # Rows are written to the shard of its EC number (same shards of the parallel generation).
+        shard_of_ec = {}
 
-                            cluster_id = self.generate_cluster_next_id()
+        if self.shards > 1:
+            shard_of_ec = self.assign_shards(ecs_and_its_clusters)
 
-                            protein_id = self.protein_id(line)
+        file_destinations = [self.open_insert_file(temporary_file, 'ab') for temporary_file in manifest.temporary_files]
 
-                            if protein_id:
-                                data = [
-                                    str(cluster_id),
-                                    str(cluster_identification),
-                                    str(ec_id),
-                                    str(protein_id),
-                                    str(clustering_method_id)]
+        # Processed files not recorded in the manifest yet.
+        pending = []
 
-                                self.write_insert_file(file_destination, data)
+        def record_pending():
+            for file_destination in file_destinations:
+                file_destination.checkpoint()
 
-                                data = []
+            for file_path, lines, rows, first_id, identification, shard in pending:
+                manifest.add(file_path, lines, rows, first_id, identification, file_destinations[shard].tell(), shard)
 
-                    self.log.info('Done Processing file: ' + str(file_to_read))
+            del pending[:]
 
-                self.log.info('Done Processing EC number: ' + str(ec) + '.')
+        try:
+            for file_destination in file_destinations:
+                self.start_insert_file(file_destination)
+
+            def file_done(file_path, lines, rows, first_id, identification, ec):
+                pending.append((file_path, lines, rows, first_id, identification, shard_of_ec.get(ec, 0)))
+
+                self.metrics.set('bytes_written', sum([file_destination.tell() for file_destination in file_destinations]))
+
+                # A compressed file can only be truncated at the end of a gzip member. All the
+                # shards are checkpointed together, so the manifest keeps the serial order.
+                if any([file_destination.checkpoint_due() for file_destination in file_destinations]):
+                    record_pending()
+
+            batches = self.result_file_batches(
+                ecs_and_its_clusters,
+                skip_files=processed_files,
+                file_done=file_done)
+
+            for ec, ec_id, cluster_identification, first_id, protein_ids in batches:
+                self.write_insert_block(
+                    file_destinations[shard_of_ec.get(ec, 0)],
+                    first_id,
+                    cluster_identification,
+                    ec_id,
+                    protein_ids,
+                    clustering_method_id)
+
+            # Before the trailers: a resumed generation writes them again.
+            record_pending()
+
+            for file_destination in file_destinations:
+                self.finish_insert_file(file_destination)
+
+        finally:
+            for file_destination in file_destinations:
+                file_destination.close()
+
+        manifest.finish()
+
+        self.metrics.set('bytes_written', self.insert_files_size(manifest))
+        self.metrics.finish_stage()
+
+        self.log_resolver_statistics()
 
         self.log.info('-- DONE -- :clusteringloader:generate_insert_files')
 
-    def write_insert_file(self, file_handle=None, data=None):
+    def insert_rows(self, ecs_and_its_clusters=None, clustering_method_id=None, skip_files=None, file_done=None):
         """
-        Actual write the insert instructions file that'll be inserted later into the realational database.
+        Read the result files and resolve every record into a 'clusters' row.
 
         Args:
-            file_handle(file): File to store the data.
-            data(list): List of values to insert into file.
+            ecs_and_its_clusters(dict): EC numbers and its clusters.
+            clustering_method_id(int): Clustering method database id.
+            skip_files(set): Result files already processed (they must be the first ones).
+            file_done(function): Called after the rows of each result file (see result_file_batches).
+
+        Returns:
+            (generator): Lists of values (id, identification, ec_id, protein_id, clustering_method_id).
 
         """
 
-        values = '\t'.join(data)
+        batches = self.result_file_batches(ecs_and_its_clusters, skip_files, file_done)
 
-        file_handle.write(values + "\n")
+        for ec, ec_id, cluster_identification, first_id, protein_ids in batches:
 
-    def check_psql_can_execute_command(self):
+            cluster_id = first_id
+
+            for protein_id in protein_ids:
+
+                if protein_id:
+                    yield [
+                        cluster_id,
+                        cluster_identification,
+                        ec_id,
+                        protein_id,
+                        clustering_method_id]
+
+                cluster_id += 1
+
+    def result_file_batches(self, ecs_and_its_clusters=None, skip_files=None, file_done=None):
         """
-        Check if this loader can execute 'psql' commands.
+        Read the result files and resolve all the records of each file at once.
 
-        If not... nothing is going to work.
+        Each file gets one cluster identification and a block of consecutive cluster ids,
+        one per line (resolved or not), starting at the given first id.
+
+        Args:
+            ecs_and_its_clusters(dict): EC numbers and its clusters.
+            skip_files(set): Result files already processed (they must be the first ones).
+            file_done(function): Called after each result file is consumed with (file path, total of
+                lines, total of rows, first cluster id, cluster identification, EC number).
 
         Returns:
-            (boolean): True (you can do stuff in PostgreSQL), False (you're screwed, call for help, it's a loader, don't expect to be happy here. You not even know if at this moment you're really using PostgreSQL).
+            (generator): Tuples (EC number, EC number id, cluster identification, first cluster id, protein ids).
 
         """
 
-        self.log.info('-- START -- :clusteringloader:check_psql_can_execute_command')
+        # (EC number, result file) to be processed, in order.
+        files = []
 
-        # Database user name from the configuration file.
-        username = self.user
+        for ec, clusters in ecs_and_its_clusters.iteritems():
 
-        # This command only list the tables from the database.
-        command = 'psql -U ' + username + " -c '\dt'"
+            for cluster in clusters:
+                # Remount the source cluster file name in order to read the
+                # file results.
+                file_to_read = self.source_data + '/EC_' + \
+                    str(ec) + '.fasta_' + str(cluster)
 
-        result = subprocess.call(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE)
+                if skip_files and file_to_read in skip_files:
+                    self.metrics.add('bytes_skipped', self.result_file_size(file_to_read))
+                    continue
 
-        # Zero means (from the subprocess package) the command could be
-        # executed without errors.
-        if result == 0:
-            return True
-        else:
+                files.append((ec, file_to_read))
 
-            self.log.info('-- ERROR -- :clusteringloader:check_psql_can_execute_command: Cannot execute psql command.')
+        # Next result files are read by other threads while this one is resolved.
+        prefetcher = ResultFilePrefetcher(
+            [file_to_read for ec, file_to_read in files],
+            self.prefetch_threads,
+            self.prefetch_files)
 
-            return False
+        # Checked once, not per file.
+        log_files = self.log.isEnabledFor(logging.DEBUG)
 
-        self.log.info('-- DONE -- :clusteringloader:check_psql_can_execute_command')
+        current_ec = None
+        ec_id = None
 
-    def load_file(self):
+        try:
+            for position, contents in enumerate(prefetcher):
+
+                ec, file_to_read = files[position]
+
+                if ec != current_ec:
+                    if current_ec is not None:
+                        self.log.info('Done Processing EC number: %s.', current_ec)
+
+                    self.log.info('Processing EC number: %s (%d clusters).', ec, len(ecs_and_its_clusters[ec]))
+
+                    current_ec = ec
+                    ec_id = self.ec_number_id(str(ec))
+
+                if log_files:
+                    self.log.debug('Processing file: %s', file_to_read)
+
+                cluster_identification = self.generate_cluster_next_identification()
+
+                # All the identifications of the file are resolved at once.
+                protein_ids = self.resolve_protein_ids(self.result_file_lines(contents))
+
+                lines = len(protein_ids)
+                rows = lines - protein_ids.count(None)
+
+                # One id per line: the whole block is taken at once.
+                first_id = self.get_last_cluster_id() + 1
+
+                self.last_cluster_primary_key = first_id + lines - 1
+
+                yield ec, ec_id, cluster_identification, first_id, protein_ids
+
+                self.metrics.add('files')
+                self.metrics.add('lines', lines)
+                self.metrics.add('rows', rows)
+                self.metrics.add('unresolved', lines - rows)
+                self.metrics.add('bytes_read', len(contents))
+
+                if file_done:
+                    file_done(file_to_read, lines, rows, first_id, cluster_identification, ec)
+
+                self.metrics.progress()
+
+                if log_files:
+                    self.log.debug('Done Processing file: %s (%d lines, %d rows).', file_to_read, lines, rows)
+
+                elif self.log_every_files and self.metrics.counters['files'] % self.log_every_files == 0:
+                    self.log.info('Processed %d files (last one: %s).', self.metrics.counters['files'], file_to_read)
+
+        finally:
+            prefetcher.close()
+
+        if current_ec is not None:
+            self.log.info('Done Processing EC number: %s.', current_ec)
+
+    def count_cluster_ids(self, ecs_and_its_clusters=None):
         """
-        This is the serious business.
+        Count how many cluster ids (one per line) and identifications (one per file) the result files need.
 
-        This methos insert into the relational database all the result data.
+        Args:
+            ecs_and_its_clusters(dict): EC numbers and its clusters.
+
+        Returns:
+            (tuple): Total of ids and total of identifications.
 
         """
 
-        self.log.info('-- START -- :clusteringloader:load_file')
+        total_of_ids = 0
+        total_of_identifications = 0
 
-        if not self.check_psql_can_execute_command():
-            print("ERROR:")
-            print(
-                "I cannot execute 'psql' command properly, so I won't try to load data.")
-            print("Maybe it means you don't have a properly $HOME/.pgpass correct file.")
-            print(
-                "Try to create in you $USER directory a file .pgpass with the following data: ")
-            print("localhost:5432:kegg2017:darkmatter")
-            print(
-                "BUT it's only a suggestion. Call your database administrator to know what it is.")
+        for ec, clusters in ecs_and_its_clusters.iteritems():
 
-            self.log.info('-- ERROR -- :clusteringloader:load_file')
+            for cluster in clusters:
+                file_to_read = self.source_data + '/EC_' + \
+                    str(ec) + '.fasta_' + str(cluster)
 
-            sys.exit()
+                total_of_ids += self.count_file_lines(file_to_read)
+                total_of_identifications += 1
 
-        username = self.user
-        source_file_name = self.insert_files_directory + '/' + 'clustersInsert.psql'
+        return (total_of_ids, total_of_identifications)
 
-        self.log.info('Will load the file: ' + str(source_file_name))
+    def reserve_cluster_ids(self, total_of_ids=None, total_of_identifications=None):
+        """
+        Reserve blocks of cluster ids and identifications and start counting from them.
 
-        if not os.path.exists(source_file_name):
-            print(source_file_name + ' file not found.')
-            sys.exit()
+        Args:
+            total_of_ids(int): How many ids to reserve.
+            total_of_identifications(int): How many identifications to reserve.
 
-        columns = [
-            'id',
-            'identification',
-            'ec_id',
-            'protein_id',
-            'clustering_method_id']
-        table = 'clusters'
+        """
 
-        # ------------------------------------------------------------------------ #
-        # ---------------- THAT'S THE STUFF WE'RE LOOKING FOR -------------------- #
-        # ------------------------------------------------------------------------ #
-        # This part of the code actual inserts the data into relational database   #
-        # ------------------------------------------------------------------------ #
-        # Columns names are being put together as a list of columns (psql
-        # needed).
-        columns = ','.join(columns)
+        first_id = self.id_allocator.reserve('id', total_of_ids)
+        first_identification = self.id_allocator.reserve('identification', total_of_identifications)
 
-        self.log.info('Columns to be filled: ' + str(columns))
+        self.log.info('Reserved cluster ids: ' + str(first_id) + ' to ' + str(first_id + total_of_ids - 1) + '.')
+        self.log.info('Reserved cluster identifications: ' + str(first_identification) + ' to ' + str(first_identification + total_of_identifications - 1) + '.')
 
-        self.log.info('Will execute psql command: ' + str(columns))
-        
-        # Actual execute the command that inserts the data into relational
-        # database.
-        process = subprocess.Popen(
-            "psql -U " +
-            username +
-            " -c \"\copy " +
-            table +
-            "(" +
-            columns +
-            ") from \'" +
-            source_file_name +
-            "\';\"",
-            shell=True)
+        self.last_cluster_primary_key = first_id - 1
+        self.last_cluster_identification = first_identification - 1
 
-        self.log.info('Done Will execute psql command: ' + str(columns))
+    def count_file_lines(self, file_path=None):
+        """
+        Count the lines of a file exactly like iterating over it does (last line may have no line break).
 
-        # Things got crazy here. Some table delays a lot to be inserted and the process keep going overwhelming the next process.
-        # So we wait to make sure the tables order insertions are correct.
-        process.wait()
-        # ------------------------------------------------------------------------ #
-        # ---------------- END OF THE POPULATING PROCESS ------------------------- #
-        # ------------------------------------------------------------------------ #
+        Args:
+            file_path(str): Full path for the file.
 
-        self.log.info('-- DONE -- :clusteringloader:load_file')
+        Returns:
+            (int): Total of lines.
+
+        """
+
+        file_index = self.result_file_index()
+
+        total_of_lines = file_index.lines(file_path)
+
+        if total_of_lines is None:
+            total_of_lines = file_index.count_lines(file_path)
+
+        return total_of_lines
+
+    def assign_shards(self, ecs_and_its_clusters=None):
+        """
+        Distribute the EC numbers into the shards, balancing its total of lines (biggest EC numbers first).
+
+        Args:
+            ecs_and_its_clusters(dict): EC numbers and its clusters.
+
+        Returns:
+            (dict): EC number -> shard.
+
+        """
+
+        sizes = []
+
+        for ec, clusters in ecs_and_its_clusters.iteritems():
+            lines = 0
+
+            for cluster in clusters:
+                file_to_read = self.source_data + '/EC_' + \
+                    str(ec) + '.fasta_' + str(cluster)
+
+                lines += self.count_file_lines(file_to_read)
+
+            sizes.append((lines, ec))
+
+        shard_lines = [0] * self.shards
+        shard_of_ec = {}
+
+        for lines, ec in sorted(sizes, reverse=True):
+            shard = shard_lines.index(min(shard_lines))
+
+            shard_lines[shard] += lines
+            shard_of_ec[ec] = shard
+
+        return shard_of_ec
+
+    def plan_insert_file(self, ecs_and_its_clusters=None, clustering_method_id=None, file_name_destination=None):
+        """
+        Assign the cluster ids and identifications of every result file before processing them.
+
+        The assignment follows exactly the same order of the serial generation: one
+        identification per file and one id per line (resolved or not).
+
+        Args:
+            ecs_and_its_clusters(dict): EC numbers and its clusters.
+            clustering_method_id(int): Clustering method database id.
+            file_name_destination(str): Insert file path (used to name the parts).
+
+        Returns:
+            (list): One task (dict) per EC number.
+
+        """
+
+        tasks = []
+
+        cluster_id = self.get_last_cluster_id()
+        cluster_identification = self.get_last_cluster_identification()
+
+        for ec, clusters in ecs_and_its_clusters.iteritems():
+
+            files = []
+            lines = 0
+
+            for cluster in clusters:
+                file_to_read = self.source_data + '/EC_' + \
+                    str(ec) + '.fasta_' + str(cluster)
+
+                cluster_identification += 1
+
+                total_of_lines = self.count_file_lines(file_to_read)
+
+                files.append((file_to_read, cluster_identification, cluster_id + 1, total_of_lines))
+
+                cluster_id += total_of_lines
+                lines += total_of_lines
+
+            tasks.append({
+                'index': len(tasks),
+                'ec': ec,
+                'ec_id': self.ec_number_id(str(ec)),
+                'clustering_method_id': clustering_method_id,
+                'files': files,
+                'lines': lines,
+                'part_file': file_name_destination + '.part.' + str(len(tasks))})
+
+        # Keep going from where the plan stops (same as the serial generation).
+        self.last_cluster_primary_key = cluster_id
+        self.last_cluster_identification = cluster_identification
+
+        return tasks
+
+    def is_part_reusable(self, task=None, entries=None):
+        """
+        Check if the part file of a task (resumed generation) has exactly the planned ids.
+
+        Args:
+            task(dict): Planned task (see plan_insert_file).
+            entries(dict): Manifest entry of each result file already processed.
+
+        Returns:
+            (boolean): True if every file of the task was processed with the same ids.
+
+        """
+
+        if not os.path.exists(task['part_file']):
+            return False
+
+        for file_to_read, cluster_identification, cluster_id, total_of_lines in task['files']:
+            entry = entries.get(file_to_read)
+
+            if not entry:
+                return False
+
+            if entry['first_id'] != cluster_id or entry['identification'] != cluster_identification:
+                return False
+
+            if entry['lines'] != total_of_lines:
+                return False
+
+        return True
+
+    def generate_insert_file_parallel(self, manifest=None, ecs_and_its_clusters=None, clustering_method_id=None, resumed=False):
+        """
+        Generate the insert file using a process pool, one task per EC number.
+
+        The biggest EC numbers are processed first. Every EC number writes its own part file
+        and the parts are concatenated in the serial order at the end.
+
+        Args:
+            manifest(InsertManifest): Insert file manifest.
+            ecs_and_its_clusters(dict): EC numbers and its clusters.
+            clustering_method_id(int): Clustering method database id.
+            resumed(boolean): Reuse the parts of the EC numbers already processed.
+
+        """
+
+        global _worker_loader
+
+        file_name_destination = manifest.insert_file
+
+        self.log.info('Planning cluster ids for ' + str(len(ecs_and_its_clusters)) + ' EC numbers.')
+
+        tasks = self.plan_insert_file(ecs_and_its_clusters, clustering_method_id, file_name_destination)
+
+        shard_of_ec = {}
+
+        if self.shards > 1:
+            shard_of_ec = self.assign_shards(ecs_and_its_clusters)
+
+        pending = tasks
+
+        if resumed:
+            entries = dict([(entry['file'], entry) for entry in manifest.entries])
+
+            pending = []
+
+            # Plan order: a changed file shifts the ids of every task after it, even the
+            # ones whose parts were finished before it (workers finish in any order).
+            for task in tasks:
+                if pending or not self.is_part_reusable(task, entries):
+                    pending.append(task)
+
+            reused = tasks[:len(tasks) - len(pending)]
+
+            self.log.info('Resuming: ' + str(len(reused)) + ' EC numbers were already processed.')
+
+            reused_files = set()
+
+            for task in reused:
+                for task_file in task['files']:
+                    reused_files.add(task_file[0])
+
+                    self.metrics.add('bytes_skipped', self.result_file_size(task_file[0]))
+
+            # The entries of the parts generated again are recorded again.
+            manifest.keep(reused_files)
+
+        self.log.info('Will use: ' + str(self.workers) + ' workers.')
+
+        scheduled = sorted(pending, key=lambda task: task['lines'], reverse=True)
+
+        _worker_loader = self
+
+        # The workers log into the same handlers (stdout and log file).
+        log_queue = log_system.start_worker_queue()
+
+        pool = multiprocessing.Pool(processes=self.workers, initializer=route_worker_records, initargs=(log_queue,))
+
+        try:
+            for result in pool.imap_unordered(generate_ec_insert_part, scheduled):
+                task = tasks[result['index']]
+
+                self.resolver.hits += result['hits']
+                self.resolver.misses += result['misses']
+
+                for task_file, rows in zip(task['files'], result['file_rows']):
+                    file_to_read, cluster_identification, cluster_id, total_of_lines = task_file
+
+                    manifest.add(file_to_read, total_of_lines, rows, cluster_id, cluster_identification, None, shard_of_ec.get(task['ec'], 0))
+
+                    self.metrics.add('files')
+                    self.metrics.add('lines', total_of_lines)
+                    self.metrics.add('rows', rows)
+                    self.metrics.add('unresolved', total_of_lines - rows)
+                    self.metrics.add('bytes_read', self.result_file_size(file_to_read))
+
+                self.metrics.add('bytes_written', os.path.getsize(task['part_file']))
+                self.metrics.progress()
+
+                self.log.info('Done Processing EC number: %s (%d rows).', task['ec'], result['rows'])
+
+            pool.close()
+
+        except Exception:
+            pool.terminate()
+            raise
+
+        finally:
+            pool.join()
+            _worker_loader = None
+
+            log_system.stop_worker_queue(log_queue)
+
+        self.log.info('Merging ' + str(len(tasks)) + ' parts into: ' + ', '.join(manifest.insert_files))
+
+        file_destinations = [self.open_insert_file(temporary_file, 'wb') for temporary_file in manifest.temporary_files]
+
+        try:
+            for file_destination in file_destinations:
+                self.start_insert_file(file_destination)
+
+            # Compressed parts are complete gzip members: they're concatenated as they are.
+            for task in tasks:
+                file_destinations[shard_of_ec.get(task['ec'], 0)].append_file(task['part_file'])
+
+            for file_destination in file_destinations:
+                self.finish_insert_file(file_destination)
+
+        finally:
+            for file_destination in file_destinations:
+                file_destination.close()
+
+        manifest.finish()
+
+        for task in tasks:
+            os.remove(task['part_file'])
+
+    def result_file_size(self, file_path=None):
+        """
+        Return the size of a result file (from the result files index).
+
+        Args:
+            file_path(str): Result file path.
+
+        Returns:
+            (int): File size.
+
+        """
+
+        size = self.result_file_index().size(file_path)
+
+        if size is None:
+            size = os.path.getsize(file_path)
+
+        return size
+
+    def insert_files_size(self, manifest=None):
+        """
+        Return the total size of the generated insert file(s).
+
+        Args:
+            manifest(InsertManifest): Insert file manifest.
+
+        Returns:
+            (int): Total of bytes.
+
+        """
+
+        return sum([os.path.getsize(insert_file) for insert_file in manifest.insert_files if os.path.exists(insert_file)])
+
+    def insert_manifest(self):
+        """
+        Return the manifest of the insert file(s): file names depend on the shards and the compression.
+
+        Returns:
+            (InsertManifest): Insert file manifest.
+
+        """
+
+        suffix = ''
+
+        if self.compress:
+            suffix = '.gz'
+
+        return InsertManifest(self.insert_files_directory + '/' + 'clustersInsert.psql', self.shards, suffix)
+
+    def open_insert_file(self, file_path=None, mode='ab'):
+        """
+        Open an insert file (or part) for writing, compressed or not.
+
+        Args:
+            file_path(str): Insert file path.
+            mode(str): 'ab' to append or 'wb' to write a new file.
+
+        Returns:
+            (InsertFile): Insert file.
+
+        """
+
+        if self.compress:
+            return GzipInsertFile(file_path, mode, compresslevel=self.compress_level)
+
+        return InsertFile(file_path, mode)
+
+    def write_insert_file(self, file_handle=None, data=None):
+        """
+        Actual write the insert instructions file that'll be inserted later into the realational database.
+
+        Args:
+            file_handle(InsertFile): File to store the data.
+            data(list): List of values to insert into file.
+
+        """
+
+        if self.binary_writer:
+            file_handle.write(self.binary_writer.row(data))
+
+            return
+
+        values = '\t'.join([str(value) for value in data])
+
+        file_handle.write(values + "\n")
+
+    def write_insert_block(
+            self,
+            file_handle=None,
+            first_id=None,
+            identification=None,
+            ec_id=None,
+            protein_ids=None,
+            clustering_method_id=None):
+        """
+        Write the rows of a whole result file at once (see RowBlockFormatter).
+
+        Args:
+            file_handle(InsertFile): File to store the data.
+            first_id(int): Cluster id of the first line of the file.
+            identification(int): Cluster identification.
+            ec_id(int): EC number database id.
+            protein_ids(list): Protein database id of each line (None if not found).
+            clustering_method_id(int): Clustering method database id.
+
+        Returns:
+            (int): Total of written rows.
+
+        """
+
+        data, rows = self.block_formatter.format(first_id, identification, ec_id, protein_ids, clustering_method_id)
+
+        if rows:
+            file_handle.write(data)
+
+        return rows
+
+    def start_insert_file(self, file_handle=None):
+        """
+        Write what comes before the rows of a new insert file (binary format header).
+
+        Args:
+            file_handle(InsertFile): Insert file, opened for appending.
+
+        """
+
+        if self.binary_writer and file_handle.tell() == 0:
+            file_handle.write(self.binary_writer.header())
+
+    def finish_insert_file(self, file_handle=None):
+        """
+        Write what comes after the rows of an insert file (binary format trailer).
+
+        Args:
+            file_handle(InsertFile): Insert file.
+
+        """
+
+        if self.binary_writer:
+            file_handle.write(self.binary_writer.trailer())
+
+    def clusters_column_types(self):
+        """
+        Return the binary type ('int4' or 'int8') of each 'clusters' column loaded.
+
+        Returns:
+            (list): Column types (id, identification, ec_id, protein_id, clustering_method_id).
+
+        """
+
+        columns = ['id', 'identification', 'ec_id', 'protein_id', 'clustering_method_id']
+
+        data_types = {}
+
+        if self.session.bind.dialect.name == 'postgresql':
+            # The 'clusters' table COPY writes into (search_path), not one of the same name in another schema.
+            result = self.session.execute(text(
+                'SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute '
+                'WHERE attrelid = CAST(:table AS regclass) '
+                'AND attnum > 0 '
+                'AND NOT attisdropped'),
+                {'table': 'clusters'})
+
+            data_types = dict([(name, data_type) for name, data_type in result])
+
+        column_types = []
+
+        for column in columns:
+            if data_types.get(column) == 'bigint':
+                column_types.append('int8')
+            else:
+                column_types.append('int4')
+
+        return column_types
+
+    def copy_options(self, freeze=False):
+        """
+        Return the COPY options for the insert file format.
+
+        Args:
+            freeze(boolean): COPY FREEZE (the table was created by the same transaction).
+
+        Returns:
+            (str): COPY options ('' for the text format).
+
+        """
+
+        options = []
+
+        if self.insert_format == 'binary':
+            options.append('format binary')
+
+        if freeze:
+            options.append('freeze')
+
+        if not options:
+            return ''
+
+        return ' with (' + ', '.join(options) + ')'
+
+    def check_psql_can_execute_command(self):
+        """
+        Check if this loader can execute 'psql' commands.
+
+        If not... nothing is going to work.
+
+        Returns:
+            (boolean): True (you can do stuff in PostgreSQL), False (you're screwed, call for help, it's a loader, don't expect to be happy here. You not even know if at this moment you're really using PostgreSQL).
+
+        """
+
+        self.log.info('-- START -- :clusteringloader:check_psql_can_execute_command')
+
+        # This command only list the tables from the database.
+        command = "psql -c '\dt'"
+
+        result = subprocess.call(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=self.psql_environment())
+
+        # Zero means (from the subprocess package) the command could be
+        # executed without errors.
+        if result == 0:
+            return True
+        else:
+
+            self.log.info('-- ERROR -- :clusteringloader:check_psql_can_execute_command: Cannot execute psql command.')
+
+            return False
+
+        self.log.info('-- DONE -- :clusteringloader:check_psql_can_execute_command')
+
+    def load_file(self):
+        """
+        This is the serious business.
+
+        This methos insert into the relational database all the result data.
+
+        """
+
+        self.log.info('-- START -- :clusteringloader:load_file')
+
+        if not self.check_psql_can_execute_command():
+            print("ERROR:")
+            print(
+                "I cannot execute 'psql' command properly, so I won't try to load data.")
+            print("Maybe it means you don't have a properly $HOME/.pgpass correct file.")
+            print(
+                "Try to create in you $USER directory a file .pgpass with the following data: ")
+            print("localhost:5432:kegg2017:darkmatter")
+            print(
+                "BUT it's only a suggestion. Call your database administrator to know what it is.")
+
+            self.log.info('-- ERROR -- :clusteringloader:load_file')
+
+            raise RuntimeError("Cannot execute 'psql' commands: nothing was loaded.")
+
+        self.metrics.start_stage('load')
+
+        self.loaded_ids = self.insert_manifest().id_range()
+
+        # Shards are copied by different connections: no COPY FREEZE.
+        load = self.start_load_table(freeze=self.shards == 1)
+
+        succeeded = False
+
+        try:
+            if self.shards > 1:
+                self.load_shards()
+
+                succeeded = True
+            else:
+                succeeded = self.load_single_file()
+
+        finally:
+            self.finish_load_table(load, succeeded)
+
+        self.metrics.finish_stage()
+
+        # psql failed (its errors were logged): the load was discarded.
+        if not succeeded:
+            self.log.info('-- ERROR -- :clusteringloader:load_file')
+
+            raise RuntimeError(self.insert_manifest().insert_file + ' could not be loaded: nothing was loaded.')
+
+        self.log.info('-- DONE -- :clusteringloader:load_file')
+
+    def load_single_file(self):
+        """
+        Load the (not sharded) insert file by a single 'psql' process.
+
+        Returns:
+            (boolean): True if psql loaded the file.
+
+        """
+
+        source_file_name = self.insert_manifest().insert_file
+
+        self.log.info('Will load the file: ' + str(source_file_name))
+
+        if not os.path.exists(source_file_name):
+            raise IOError(source_file_name + ' file not found.')
+
+        columns = [
+            'id',
+            'identification',
+            'ec_id',
+            'protein_id',
+            'clustering_method_id']
+        table = self.load_table
+
+        # ------------------------------------------------------------------------ #
+        # ---------------- THAT'S THE STUFF WE'RE LOOKING FOR -------------------- #
+        # ------------------------------------------------------------------------ #
+        # This part of the code actual inserts the data into relational database   #
+        # ------------------------------------------------------------------------ #
+        # Columns names are being put together as a list of columns (psql
+        # needed).
+        columns = ','.join(columns)
+
+        self.log.info('Columns to be filled: ' + str(columns))
+
+        self.log.info('Will execute psql command: ' + str(columns))
+        
+        # The new partition table is created by the same transaction (single transaction
+        # psql): the rows are copied frozen.
+        create_table = ''
+
+        if self.load_table_statement:
+            create_table = " -1 -c \"" + self.load_table_statement + ";\""
+
+        # Actual execute the command that inserts the data into relational
+        # database.
+        process = subprocess.Popen(
+            "psql -v ON_ERROR_STOP=1" +
+            create_table +
+            " -c \"\copy " +
+            table +
+            "(" +
+            columns +
+            ") from " +
+            self.copy_source(source_file_name) +
+            self.copy_options(self.load_table_statement is not None) +
+            ";\"",
+            shell=True,
+            stdin=self.copy_stdin(),
+            env=self.psql_environment())
+
+        feeder = self.feed_copy_process(process, source_file_name)
+
+        self.log.info('Done Will execute psql command: ' + str(columns))
+
+        # Things got crazy here. Some table delays a lot to be inserted and the process keep going overwhelming the next process.
+        # So we wait to make sure the tables order insertions are correct.
+        process.wait()
+
+        if feeder:
+            feeder.join()
+
+            if feeder.error:
+                self.log.info('-- ERROR -- :clusteringloader:load_file: ' + str(source_file_name) + ' could not be decompressed: ' + str(feeder.error))
+        # ------------------------------------------------------------------------ #
+        # ---------------- END OF THE POPULATING PROCESS ------------------------- #
+        # ------------------------------------------------------------------------ #
+
+        if process.returncode != 0:
+            self.log.info('-- ERROR -- :clusteringloader:load_file: psql exit status: ' + str(process.returncode))
+
+        return process.returncode == 0 and not (feeder and feeder.error)
+
+    def staged_load(self):
+        """
+        Return the staged load of the 'replace' and 'merge' modes.
+
+        Returns:
+            (StagedLoad): Staged load or None for the 'append' mode.
+
+        """
+
+        if self.mode not in StagedLoad.modes:
+            return None
+
+        return StagedLoad(self.session, 'clusters', self.mode, self.clustering_method_id_from_name(self.label))
+
+    def partition_load(self):
+        """
+        Return the partition load, if 'clusters' is partitioned by clustering method.
+
+        A new partition is loaded when the clustering method has none yet or, with the
+        'replace' mode, to take the place of its partition. Otherwise ('append' and 'merge')
+        the rows go to the partition that's already attached.
+
+        Returns:
+            (PartitionLoad): Partition load or None.
+
+        """
+
+        partition_load = PartitionLoad(self.session, 'clusters', self.clustering_method_id_from_name(self.label))
+
+        if not partition_load.is_partitioned():
+            return None
+
+        if self.mode != 'replace' and partition_load.existing_partition():
+            return None
+
+        return partition_load
+
+    def start_load_table(self, freeze=False):
+        """
+        Get the table the rows are copied into ready: a new partition ('clusters' partitioned
+        by clustering method), the staging table of the 'replace' and 'merge' modes or
+        'clusters' itself.
+
+        Args:
+            freeze(boolean): The COPY transaction creates the new partition table (COPY FREEZE).
+
+        Returns:
+            (object): PartitionLoad, StagedLoad or None (rows copied into 'clusters').
+
+        """
+
+        load = self.partition_load()
+
+        if load:
+            load.prepare(create=not freeze)
+
+            self.load_table = load.new_table
+
+            if freeze:
+                self.load_table_statement = load.create_statement()
+
+            self.log.info('Partitioned clusters: rows are loaded into the new table: ' + load.new_table + '.')
+
+            return load
+
+        load = self.staged_load()
+
+        if load:
+            load.prepare()
+
+            self.load_table = load.staging_table
+
+            self.log.info('Mode: ' + str(self.mode) + '. Rows are loaded into: ' + load.staging_table + ' first.')
+
+        return load
+
+    def finish_load_table(self, load=None, succeeded=True):
+        """
+        Attach the new partition or move the staged rows into 'clusters' or, if the load
+        failed, drop them.
+
+        Args:
+            load(object): PartitionLoad, StagedLoad or None (see start_load_table).
+            succeeded(boolean): True if all the rows were copied.
+
+        """
+
+        self.load_table = 'clusters'
+        self.load_table_statement = None
+
+        if not succeeded:
+            self.loaded_ids = None
+
+            if load:
+                self.log.info('-- ERROR -- The load failed: clusters was not changed.')
+
+                load.discard()
+
+            return
+
+        if isinstance(load, PartitionLoad):
+            replaced = load.attach()
+
+            self.log.info(
+                'Attached partition: ' + load.new_table + ' (clustering method: ' +
+                str(load.clustering_method_id) + ').' +
+                (' Replaced partition: ' + replaced + '.' if replaced else ''))
+
+        elif load:
+            deleted, inserted = load.apply()
+
+            self.log.info(
+                'Mode: ' + str(self.mode) + '. Clustering method: ' + str(load.clustering_method_id) +
+                ': deleted ' + str(deleted) + ' rows, inserted ' + str(inserted) + ' rows.')
+
+        self.update_cluster_summaries(load)
+
+    def update_cluster_summaries(self, load=None):
+        """
+        Update 'cluster_summaries' from the rows just loaded (their cluster ids range).
+
+        Args:
+            load(object): PartitionLoad, StagedLoad or None (see start_load_table).
+
+        """
+
+        loaded_ids = self.loaded_ids
+        self.loaded_ids = None
+
+        if not self.summaries or not loaded_ids:
+            return
+
+        self.log.info('-- START -- :clusteringloader:update_cluster_summaries')
+
+        # Attaching a partition replaces all the rows of the clustering method too.
+        mode = self.mode
+
+        if isinstance(load, PartitionLoad):
+            mode = 'replace'
+
+        first_id, last_id = loaded_ids
+
+        updated = ClusterSummaries(self.session, 'clusters').update(
+            self.clustering_method_id(),
+            first_id,
+            last_id,
+            mode)
+
+        if updated is None:
+            self.log.info('Created cluster_summaries from all the clusters rows.')
+        else:
+            self.log.info(
+                'Cluster summaries updated: ' + str(updated) + ' (cluster ids ' +
+                str(first_id) + ' to ' + str(last_id) + ').')
+
+        self.log.info('-- DONE -- :clusteringloader:update_cluster_summaries')
+
+    def copy_source(self, file_path=None):
+        """
+        Return where '\\copy' reads an insert file from: the file itself or, if it's compressed, psql standard input.
+
+        Args:
+            file_path(str): Insert file path.
+
+        Returns:
+            (str): '\\copy ... from' source.
+
+        """
+
+        if self.compress:
+            return 'pstdin'
+
+        return "\'" + file_path + "\'"
+
+    def copy_stdin(self):
+        """
+        Return the standard input for the 'psql' processes (a pipe to feed compressed insert files).
+
+        Returns:
+            (int): subprocess.PIPE or None.
+
+        """
+
+        if self.compress:
+            return subprocess.PIPE
+
+    def feed_copy_process(self, process=None, file_path=None):
+        """
+        Decompress a compressed insert file into the standard input of a 'psql' process, in a thread.
+
+        If the file can't be completely decompressed, psql is killed before the end of the
+        input: COPY is never committed with part of the rows.
+
+        Args:
+            process(Popen): 'psql' process started with copy_stdin().
+            file_path(str): Insert file path.
+
+        Returns:
+            (Thread): The thread ('error' attribute is set on failure) or None if the file isn't compressed.
+
+        """
+
+        if not self.compress:
+            return None
+
+        def feed():
+            try:
+                source = gzip.open(file_path, 'rb')
+
+                try:
+                    shutil.copyfileobj(source, process.stdin, 16777216)
+                finally:
+                    source.close()
+
+            except Exception as e:
+                feeder.error = e
+                process.kill()
+
+            finally:
+                try:
+                    process.stdin.close()
+                except IOError:
+                    pass
+
+        feeder = threading.Thread(target=feed)
+        feeder.daemon = True
+        feeder.error = None
+        feeder.start()
+
+        return feeder
+
+    def psql_environment(self):
+        """
+        Return the environment for the 'psql' processes: the same database of the session
+        (PGHOST, PGPORT, PGDATABASE...) and the load session settings (PGOPTIONS).
+
+        Returns:
+            (dict): Environment variables.
+
+        """
+
+        environment = dict(os.environ)
+
+        database = Connection().environment(self.database_url())
+
+        # A DSN without user name: the one of --user, like before.
+        if 'PGUSER' not in database and self.user:
+            database['PGUSER'] = self.user
+
+        environment.update(database)
+
+        if self.load_session_settings:
+            options = ['-c ' + name + '=' + value for name, value in sorted(self.load_session_settings.iteritems())]
+
+            environment['PGOPTIONS'] = ' '.join(options)
+
+        return environment
+
+    def bulk_load_file(self):
+        """
+        Load the insert file(s) without the 'clusters' secondary indexes and constraints.
+
+        The indexes and constraints (except the primary key) are recorded and dropped, the
+        load sessions don't wait for synchronous commits, and at the end (even if the load
+        fails) the indexes are built again, the constraints validated and the table analyzed.
+
+        """
+
+        self.log.info('-- START -- :clusteringloader:bulk_load_file')
+
+        # Dropping the indexes of a partitioned table drops them from every partition. A new
+        # partition is loaded without indexes anyway: they're built before it's attached.
+        if PartitionLoad(self.session, 'clusters').is_partitioned():
+            self.log.info('Partitioned clusters: indexes and constraints are kept.')
+
+            self.load_file()
+
+            self.log.info('-- DONE -- :clusteringloader:bulk_load_file')
+
+            return
+
+        bulk_load = BulkLoad(
+            self.session,
+            'clusters',
+            self.insert_files_directory + '/' + 'clustersBulkLoad.json',
+            self.maintenance_work_mem)
+
+        # A previous bulk load died before putting the table back to normal.
+        if bulk_load.load():
+            self.log.info('Restoring indexes and constraints left by a previous bulk load.')
+            bulk_load.restore()
+
+        bulk_load.prepare()
+
+        for name, definition in bulk_load.indexes:
+            self.log.info('Dropped index: ' + str(name) + ': ' + str(definition))
+
+        for name, definition, kind in bulk_load.constraints:
+            self.log.info('Dropped constraint: ' + str(name) + ': ' + str(definition))
+
+        self.load_session_settings = bulk_load.session_settings()
+
+        try:
+            self.load_file()
+
+        finally:
+            self.load_session_settings = {}
+
+            self.log.info('Building indexes and constraints again.')
+
+            not_validated = bulk_load.restore()
+
+            for name in not_validated:
+                self.log.info('-- ERROR -- Constraint: ' + str(name) + ' could not be validated (kept as NOT VALID).')
+
+        self.log.info('-- DONE -- :clusteringloader:bulk_load_file')
+
+    def load_shards(self):
+        """
+        Load all the insert file shards at the same time, one 'psql' process (connection) per shard.
+
+        Each shard is a separated transaction. The exit status and the total of loaded rows
+        of each shard are logged and any failed shard raises an error (RuntimeError).
+
+        """
+
+        self.log.info('-- START -- :clusteringloader:load_shards')
+
+        columns = ','.join([
+            'id',
+            'identification',
+            'ec_id',
+            'protein_id',
+            'clustering_method_id'])
+
+        shard_files = self.insert_manifest().insert_files
+
+        for shard_file in shard_files:
+            if not os.path.exists(shard_file):
+                raise IOError(shard_file + ' file not found.')
+
+        processes = []
+
+        for shard_file in shard_files:
+
+            self.log.info('Will load the shard: ' + str(shard_file))
+
+            process = subprocess.Popen(
+                "psql -v ON_ERROR_STOP=1" +
+                " -c \"\\copy " +
+                self.load_table +
+                "(" +
+                columns +
+                ") from " +
+                self.copy_source(shard_file) +
+                self.copy_options() +
+                ";\"",
+                shell=True,
+                stdin=self.copy_stdin(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env=self.psql_environment())
+
+            processes.append((shard_file, process, self.feed_copy_process(process, shard_file)))
+
+        failed = []
+
+        for shard_file, process, feeder in processes:
+
+            if feeder:
+                feeder.join()
+
+                # Already closed by the feeder.
+                process.stdin = None
+
+                if feeder.error:
+                    self.log.info('-- ERROR -- Shard: ' + str(shard_file) + ' could not be decompressed: ' + str(feeder.error))
+
+            output, errors = process.communicate()
+
+            loaded = re.search('COPY ([0-9]+)', output)
+
+            if process.returncode == 0 and loaded:
+                self.log.info('Shard: ' + str(shard_file) + ' loaded: ' + loaded.group(1) + ' rows.')
+
+                self.metrics.add('rows_loaded', int(loaded.group(1)))
+            else:
+                self.log.info('-- ERROR -- Shard: ' + str(shard_file) + ' exit status: ' + str(process.returncode) + ' ' + str(errors).strip())
+
+                failed.append(shard_file)
+
+        if failed:
+            self.log.info('-- ERROR -- :clusteringloader:load_shards')
+
+            self.metrics.finish_stage()
+
+            raise RuntimeError('These shards could not be loaded (the other ones were): ' + ', '.join(failed))
+
+        self.log.info('-- DONE -- :clusteringloader:load_shards')
+
+    def staging_rows(self):
+        """
+        Return the raw records from the result files, without any database resolution.
+
+        Returns:
+            (generator): Lists of (EC number, cluster file suffix, lowercased protein identification, line ordinal).
+
+        """
+
+        ecs_and_its_clusters = self.ecs_and_its_clusters()
+
+        for ec, clusters in ecs_and_its_clusters.iteritems():
+
+            self.log.info('Processing EC number: ' + str(ec) + '.')
+
+            for cluster in clusters:
+                file_to_read = self.source_data + '/EC_' + \
+                    str(ec) + '.fasta_' + str(cluster)
+
+                with open(file_to_read) as f:
+
+                    ordinal = 0
+
+                    for line in f:
+                        line = line.rstrip('\r\n')
+                        line = line.lower()
+
+                        ordinal += 1
+
+                        yield [ec, cluster, line, ordinal]
+
+    def load_through_staging_table(self):
+        """
+        Load the results resolving proteins and EC numbers ids inside the relational database.
+
+        The raw records are copied into an UNLOGGED staging table and a single
+        INSERT ... SELECT joining 'proteins' and 'ecs' populates 'clusters'.
+        Everything happens in a single transaction.
+
+        """
+
+        self.log.info('-- START -- :clusteringloader:load_through_staging_table')
+        self.log.info('Label: ' + str(self.label) + '.')
+        self.log.info('Source: ' + str(self.source_data) + '.')
+
+        clustering_method_id = self.prepare_clustering_method()
+
+        self.log.info('Checking files consistency.')
+
+        self.check_files_consistency()
+
+        self.log.info('Will process: ' + str(len(self.valid_files)) + ' files.')
+        self.log.info('Will ignore: ' + str(len(self.invalid_files)) + ' files.')
+
+        # One staging table per clustering method, so different labels can be loaded at the same time.
+        staging_table = 'clusters_staging_' + str(clustering_method_id)
+
+        load = self.start_load_table()
+
+        succeeded = False
+
+        connection = self.session.connection().connection
+        cursor = connection.cursor()
+
+        try:
+            cursor.execute('DROP TABLE IF EXISTS ' + staging_table)
+            cursor.execute(
+                'CREATE UNLOGGED TABLE ' + staging_table + ' ('
+                'ec_number varchar, '
+                'cluster varchar, '
+                'identification varchar, '
+                'ordinal integer)')
+
+            self.log.info('Copying raw records into: ' + staging_table + '.')
+
+            stream = CopyStream(self.staging_rows())
+
+            cursor.copy_expert(
+                'COPY ' + staging_table + ' (ec_number, cluster, identification, ordinal) FROM STDIN',
+                stream)
+
+            self.log.info('Copied: ' + str(stream.total_rows) + ' raw records.')
+
+            if self.id_allocator:
+                self.reserve_cluster_ids(stream.total_rows, len(self.valid_files))
+
+            last_id = self.get_last_cluster_id()
+            last_identification = self.get_last_cluster_identification()
+
+            self.log.info('Resolving proteins and EC numbers into clusters.')
+
+            # Cluster files are ordered by EC number and then by its numeric suffix.
+            cursor.execute(
+                'INSERT INTO ' + self.load_table + ' (id, identification, ec_id, protein_id, clustering_method_id) '
+                'SELECT '
+                '%(last_id)s + row_number() OVER '
+                '(ORDER BY s.ec_number, length(s.cluster), s.cluster, s.ordinal), '
+                '%(last_identification)s + dense_rank() OVER '
+                '(ORDER BY s.ec_number, length(s.cluster), s.cluster), '
+                'e.id, '
+                'p.id, '
+                '%(clustering_method_id)s '
+                'FROM ' + staging_table + ' s '
+                'JOIN proteins p ON p.identification = s.identification '
+                'JOIN ecs e ON e.ec = s.ec_number',
+                {
+                    'last_id': last_id,
+                    'last_identification': last_identification,
+                    'clustering_method_id': clustering_method_id})
+
+            self.log.info('Inserted: ' + str(cursor.rowcount) + ' clusters records.')
+
+            cursor.execute('DROP TABLE ' + staging_table)
+
+            self.session.commit()
+
+            succeeded = True
+
+            self.loaded_ids = (last_id + 1, last_id + stream.total_rows)
+
+            # The next load (same process) starts after them: at most one identification per file.
+            self.last_cluster_primary_key = last_id + stream.total_rows
+            self.last_cluster_identification = last_identification + len(self.valid_files)
+
+        except Exception:
+            self.log.info('-- ERROR -- :clusteringloader:load_through_staging_table')
+            self.session.rollback()
+            raise
+
+        finally:
+            cursor.close()
+
+            self.finish_load_table(load, succeeded)
+
+        self.log.info('-- DONE -- :clusteringloader:load_through_staging_table')
+
+    def prepare_cluster_records(self, preload=False):
+        """
+        Get everything ready to generate the 'clusters' records: clustering method, result
+        files check, resolver and first ids (after the last ones in the database or reserved).
+
+        Args:
+            preload(boolean): Always resolve from memory (default: only if configured to).
+
+        Returns:
+            (tuple): EC numbers and its clusters (dict), clustering method database id.
+
+        """
+
+        self.log.info('Label: ' + str(self.label) + '.')
+        self.log.info('Source: ' + str(self.source_data) + '.')
+
+        clustering_method_id = self.prepare_clustering_method()
+
+        self.log.info('Checking files consistency.')
+
+        self.check_files_consistency()
+
+        self.log.info('Will process: ' + str(len(self.valid_files)) + ' files.')
+        self.log.info('Will ignore: ' + str(len(self.invalid_files)) + ' files.')
+
+        ecs_and_its_clusters = self.ecs_and_its_clusters()
+
+        if (preload or self.preload_proteins or self.resolver_snapshot) and not self.resolver:
+            self.preload_resolver()
+
+        if self.id_allocator:
+            self.reserve_cluster_ids(*self.count_cluster_ids(ecs_and_its_clusters))
+
+        self.last_cluster_primary_key = self.get_last_cluster_id()
+        self.last_cluster_identification = self.get_last_cluster_identification()
+
+        return ecs_and_its_clusters, clustering_method_id
+
+    def iter_cluster_records(self, preload=False):
+        """
+        Yield every 'clusters' record of the clustering results, without writing anything.
+
+        Records are generated while the result files are read (one file in memory at a time,
+        plus the prefetched ones), so they can feed any writer, COPY stream or exporter. The
+        preparation (see prepare_cluster_records) happens when the first record is asked for.
+
+        Args:
+            preload(boolean): Always resolve from memory (needed if the database session is
+                busy while the records are consumed).
+
+        Returns:
+            (generator): Tuples (id, identification, ec_id, protein_id, clustering_method_id).
+
+        """
+
+        ecs_and_its_clusters, clustering_method_id = self.prepare_cluster_records(preload)
+
+        for row in self.insert_rows(ecs_and_its_clusters, clustering_method_id):
+            yield tuple(row)
+
+    def iter_cluster_record_batches(self, batch_size=10000, preload=False):
+        """
+        Yield the 'clusters' records (see iter_cluster_records) in lists of a fixed size.
+
+        Args:
+            batch_size(int): Records per list (the last list may be smaller).
+            preload(boolean): Always resolve from memory.
+
+        Returns:
+            (generator): Lists of record tuples.
+
+        """
+
+        batch = []
+
+        for record in self.iter_cluster_records(preload):
+            batch.append(record)
+
+            if len(batch) >= batch_size:
+                yield batch
+
+                batch = []
+
+        if batch:
+            yield batch
+
+    def load_direct(self):
+        """
+        Generate the clusters rows and stream them straight into the relational database.
+
+        No insert file is written and no 'psql' command is needed: the rows feed a
+        'COPY clusters FROM STDIN' over the loader database connection, while the result
+        files are still being read.
+
+        """
+
+        self.log.info('-- START -- :clusteringloader:load_direct')
+
+        # The connection is busy with the COPY: no query can be done while the rows are generated.
+        ecs_and_its_clusters, clustering_method_id = self.prepare_cluster_records(preload=True)
+
+        columns = ','.join([
+            'id',
+            'identification',
+            'ec_id',
+            'protein_id',
+            'clustering_method_id'])
+
+        # Ids of the generated rows: after the last one (see result_file_batches).
+        first_id = self.get_last_cluster_id() + 1
+
+        load = self.start_load_table(freeze=True)
+
+        succeeded = False
+
+        connection = self.session.connection().connection
+        cursor = connection.cursor()
+
+        stream = None
+
+        try:
+            stream = PrefetchCopyStream(
+                self.insert_rows(ecs_and_its_clusters, clustering_method_id),
+                escape=False)
+
+            options = ''
+
+            # Same transaction: the rows are copied frozen.
+            if self.load_table_statement:
+                cursor.execute(self.load_table_statement)
+
+                options = ' WITH (FREEZE)'
+
+            cursor.copy_expert('COPY ' + self.load_table + ' (' + columns + ') FROM STDIN' + options, stream)
+
+            self.session.commit()
+
+            succeeded = True
+
+            self.loaded_ids = (first_id, self.last_cluster_primary_key)
+
+            self.log.info('Loaded: ' + str(stream.total_rows) + ' clusters records.')
+
+        except Exception:
+            self.log.info('-- ERROR -- :clusteringloader:load_direct')
+            self.session.rollback()
+            raise
+
+        finally:
+            if stream:
+                stream.close()
+
+            cursor.close()
+
+            self.finish_load_table(load, succeeded)
+
+        self.log_resolver_statistics()
+
+        self.log.info('-- DONE -- :clusteringloader:load_direct')
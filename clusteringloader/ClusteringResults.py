@@ -0,0 +1,433 @@
+import os
+import re
+import logging
+from ResultFileIndex import *
+from ResultFileValidator import *
+from LogSystem import *
+
+
+class ClusteringResults:
+    """
+    Clustering result files (EC_<ec number>.fasta_<cluster>) and its metadata.
+
+    Everything here only reads the file system: listing, checking and counting the result
+    files needs no database (and doesn't import SQLAlchemy).
+
+    """
+
+    def __init__(
+            self,
+            source_data=None,
+            metadata_file=None,
+            index_file=None,
+            strict_validation=False,
+            workers=1,
+            log_file=None,
+            log_level='info'):
+
+        # Metadata about the clustering results
+        # Theese values will be overridden by the metadata file loading.
+        self.label = None
+        self.date = None 
+        self.author = None 
+        self.software = None 
+        self.source_data = None 
+
+        # Where are the clustering results
+        self.source_data = source_data
+
+        # Logging
+        self.log_file = log_file
+
+        # Verbosity ('debug', 'info', 'warning' or 'error').
+        self.log_level = log_level
+
+        # To store what files are ok or not to be loaded into relational database. 
+        self.valid_files = []
+        self.invalid_files = []
+
+        # Result files are read only once (and not again while unchanged, if the index is saved).
+        self.index_file = index_file
+        self.file_index = None
+
+        # Check every line of every result file (not only the first one).
+        self.strict_validation = strict_validation
+
+        # How many processes validate the result files (strict validation) and generate the insert file.
+        self.workers = workers
+
+        # Just for report... don't really need that.
+        self.ecs_with_single_cluster = None
+        self.ecs_with_two_clusters = None
+        self.ecs_with_more_than_two_clusters = None
+
+        # This project expect to load millions of records into the relational database.
+        # No way to run it without making sure everything can be tracked by a log file.
+        self.create_log_system(self.log_file, self.log_level)
+
+        if metadata_file:
+            self.generate_metadata_from_file(metadata_file)
+
+    def create_log_system(self, log_file=None, log_level='info'):
+        """
+        Set all logger parameters (file log path, for example), output format and set the class p
+
+        Log the process is extremely important because we don't know how long it will take.
+
+        Records go through a queue: formatting and writing (stdout and log file) happen in a
+        background thread, not in the loader thread. Calling it again doesn't duplicate handlers.
+
+        """
+
+        level = getattr(logging, str(log_level).upper(), logging.INFO)
+
+        self.log = log_system.configure(log_file, level)
+
+    def result_files(self):
+        """
+        Get the list of cluster result files.
+
+        Returns:
+            (list): List of cluster result file paths.
+
+        """
+
+        return self.result_file_index().files()
+
+    def result_file_index(self):
+        """
+        Return the result files index, reading the source directory only in the first call.
+
+        Returns:
+            (ResultFileIndex): Result files index.
+
+        """
+
+        if not self.file_index:
+
+            if self.strict_validation:
+                file_index = ResultFileIndex(self.source_data, self.index_file, 'strict')
+                file_index.build(validate_files=self.validate_result_files)
+
+                self.log_validation_report(file_index)
+
+            else:
+                file_index = ResultFileIndex(self.source_data, self.index_file)
+                file_index.build(self.is_valid_result_file)
+
+            self.file_index = file_index
+
+        return self.file_index
+
+    def validate_result_files(self, file_paths=None):
+        """
+        Check every line of the result files (strict validation), using the loader workers.
+
+        Args:
+            file_paths(list): Result file paths.
+
+        Returns:
+            (dict): Result file path -> report (validity, lines and bad line numbers).
+
+        """
+
+        self.log.info('Strict validation of: ' + str(len(file_paths)) + ' files.')
+
+        return validate_result_files(file_paths, self.workers)
+
+    def log_validation_report(self, file_index=None):
+        """
+        Log the bad line numbers of each invalid result file.
+
+        Args:
+            file_index(ResultFileIndex): Result files index.
+
+        """
+
+        for file_path, bad_lines in sorted(file_index.bad_lines().iteritems()):
+            self.log.info('Invalid file: ' + str(file_path) + ' bad lines: ' + ','.join([str(line) for line in bad_lines]))
+
+    def check_files_consistency(self):
+        """
+        Run through the result files and check if each one is a valid file.
+
+        Also creates a list of valid files and a list of invalid files.
+
+        """
+
+        file_index = self.result_file_index()
+
+        self.valid_files = file_index.valid_files()
+        self.invalid_files = file_index.invalid_files()
+
+    def is_valid_result_file(self, file_path=None):
+        """
+        Test if the cluster result file is valid (content format).
+
+        Args:
+            file_path(str): Full path for a file to be tested.
+
+        Returns:
+            (boolean): True or False.
+
+        """
+
+        # --------------------------------------------------------- #
+        # There's a lot of ways for testing files consistency...    #
+        # The problem here is to not expect too much from the file. #
+        # Maybe test if organism code doesn't have more than 3 or 4 #
+        # chars is a good idea... but think better: you won't come  #
+        # back to this code if everything is running ok for... like #
+        # 4 years. And suppose KEGG change the way of coding        #
+        # organisms, but keep the idea of separating code from      #
+        # protein using ':' char.                                   #
+        # Worse, you are importing a different database with a      #
+        # different way of coding proteins.                         #
+        # You got it: this method exists here only because it's an  #
+        # crucial step for the importer, but it have to be more     #
+        # elaborated. At this momment is not possible to say        #
+        # this method is actual implemented/done.                   #
+        # But... at least it test something.                        #
+        # --------------------------------------------------------- #
+
+        errors = 0
+        f = open(file_path)
+
+        # We're going to test only the first 2 lines (totaly arbitrary number).
+        counter = 1
+
+        total_of_lines = 0
+
+        for line in f:
+            line = line.rstrip('\r\n')
+
+            total_of_lines += 1
+
+            expected_records = line.split(':')
+
+            if len(expected_records) != 2:
+                errors += 1
+
+            counter += 1
+
+            if counter == 2:
+                counter = 1
+                f.close()
+                break
+
+        f.close()
+
+        if total_of_lines == 0:
+            errors += 1
+
+        if errors > 0:
+            return False
+        else:
+            return True
+
+    def get_valid_result_files(self):
+        """
+        Return the list of valid (content format) cluster result files.
+
+        Returns:
+            (list): List of valid cluster file paths.
+        """
+
+        return self.valid_files
+
+
+    def generate_metadata_from_file(self, metadata_file=None):
+        """
+        Generate the class metadata from the results metadata file.
+
+        Args:
+            metadata_file(str): Full path for the clustering metadata file.
+
+        """
+
+        result_metadata = {}
+
+        # Too busy and lazy to write an smarter approach.
+        with open(metadata_file) as f:
+
+            for line in f:
+                line = line.rstrip('\r\n')
+
+                records = line.split('=')
+
+                if len(line) > 1:
+                    field = re.sub(' ', '', records[0])
+
+                    value = re.sub('^ ', '', records[1])
+                    value = re.sub(' $', '', value)
+
+                    result_metadata[field] = value
+
+        self.author = result_metadata['author']
+        self.label = result_metadata['label']
+        self.date = result_metadata['date']
+        self.software = result_metadata['software']
+
+    def total_valid_files(self):
+        """
+        Return the total of valid cluster result files.
+
+        Returns:
+            (int): Total of valid files.
+
+        """
+
+        return len(self.valid_files)
+
+    def total_invalid_files(self):
+        """
+        Return the total of invalid cluster result files.
+
+        Returns:
+            (int): Total of invalid files.
+
+        """
+
+        return len(self.invalid_files)
+
+    def ec_number_from_file_name(self, file_path=None):
+        """
+        Return the EC number from the cluster result file name.
+
+        Return:
+            (str): EC number.
+
+        """
+
+        file_name = os.path.basename(file_path)
+
+        # EC_4.2.1.51.fasta_2
+
+        ec_number = re.search('^EC_(.*)\.fasta_.*', file_name)
+
+        ec_number = str(ec_number.group(1))
+
+        return ec_number
+
+    def ec_numbers(self):
+        """
+        Return the total of EC numbers found in the cluster result files.
+
+        Returns:
+            (int): Total of EC numbers.
+
+        """
+
+        ec_numbers = []
+
+        files = self.result_files()
+
+        for result_file in files:
+            ec_number = self.ec_number_from_file_name(result_file)
+
+            ec_numbers.append(ec_number)
+
+        return ec_numbers
+
+    def total_ec_numbers(self):
+        """
+        Return the total of EC numbers found in the cluster result files.
+
+        Returns:
+            (int): Total of EC numbers.
+
+        """
+
+        return len(self.ec_numbers())
+
+    def total_sequences(self):
+        """
+        Return the total of sequences found in all cluster result files.
+
+        Returns:
+            (int): Total of sequences.
+
+        """
+
+        return self.result_file_index().total_lines()
+
+    def cluster_identification_from_file(self, file_path=None):
+        """
+        Get the cluster identification form a result file.
+
+        Normally it's only a single integer.
+
+        Args:
+            file_path(str): File path or only file name.
+
+        Returns:
+            (str): Cluster identification from result file.
+
+        """
+
+        file_name = os.path.basename(file_path)
+
+        cluster_id = re.search('^EC_.*\.fasta_(.*)', file_name)
+        cluster_id = cluster_id.group(1)
+
+        return cluster_id
+
+    def total_clusters(self):
+        """
+        Return the total of clusters generated from all the clustering process.
+
+        Returns:
+            (int): Total of clusters.
+
+        """
+
+        return len(self.result_file_index().valid_files())
+
+    def generate_ecs_clusters_stats(self):
+        """
+        Generate the statistics for EC numbers and its clusters.
+
+        Returns:
+            (dict): EC numbers and its clusters statistics.
+
+        """
+
+        ecs_with_single_cluster = []
+        ecs_with_two_clusters = []
+        ecs_with_more_than_two_clusters = []
+
+        ecs_and_clusters = self.result_file_index().ecs_and_clusters()
+
+        for ec, clusters in ecs_and_clusters.iteritems():
+
+            total_clusters = len(clusters)
+
+            if int(total_clusters) == 1:
+                ecs_with_single_cluster.append(ec)
+
+            if int(total_clusters) == 2:
+                ecs_with_two_clusters.append(ec)
+
+            if int(total_clusters) > 2:
+                ecs_with_more_than_two_clusters.append(ec)
+
+        self.ecs_with_single_cluster = ecs_with_single_cluster
+        self.ecs_with_two_clusters = ecs_with_two_clusters
+        self.ecs_with_more_than_two_clusters = ecs_with_more_than_two_clusters
+
+        return {
+            'single': ecs_with_single_cluster,
+            'two': ecs_with_two_clusters,
+            'more': ecs_with_more_than_two_clusters}
+
+    # TODO: test
+    def ecs_and_its_clusters(self):
+        """
+        Return the EC numbers and its clusters from flat/raw cluster result files.
+
+        Returns:
+            (dict): EC numbers and its cluster numbers.
+
+        """
+
+        return self.result_file_index().ecs_and_clusters()
@@ -0,0 +1,281 @@
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class CopyStream:
+    """
+    Read only file-like object that feeds a PostgreSQL COPY (text format) from an iterator of rows.
+
+    Rows are only formatted when the database driver asks for more data, so there's never
+    more than about 'buffer_size' bytes waiting in memory.
+
+    """
+
+    def __init__(self, rows=None, buffer_size=1048576, escape=True):
+
+        self.rows = iter(rows)
+        self.buffer_size = buffer_size
+
+        # Rows made only of integers don't need to be escaped.
+        self.escape = escape
+
+        self.buffer = ''
+        self.exhausted = False
+
+        # How many rows were sent to the database.
+        self.total_rows = 0
+
+    def format_value(self, value=None):
+        """
+        Format a single value to the COPY text format.
+
+        Args:
+            value: Value to be formatted.
+
+        Returns:
+            (str): Escaped value.
+
+        """
+
+        if value is None:
+            return '\\N'
+
+        value = str(value)
+
+        if '\\' in value or '\t' in value or '\n' in value or '\r' in value:
+            value = value.replace('\\', '\\\\')
+            value = value.replace('\t', '\\t')
+            value = value.replace('\n', '\\n')
+            value = value.replace('\r', '\\r')
+
+        return value
+
+    def format_row(self, row=None):
+        """
+        Format a row (list of values) to a COPY text format line.
+
+        Args:
+            row(list): Values.
+
+        Returns:
+            (str): Tab separated line.
+
+        """
+
+        # Integers only, but a value not resolved (None) is still NULL.
+        if not self.escape:
+            return '\t'.join(['\\N' if value is None else str(value) for value in row]) + '\n'
+
+        return '\t'.join([self.format_value(value) for value in row]) + '\n'
+
+    def fill(self, size=None):
+        """
+        Format rows until the buffer has at least 'size' bytes or there's no more rows.
+
+        Args:
+            size(int): Minimum buffer size wanted.
+
+        """
+
+        lines = [self.buffer]
+        total = len(self.buffer)
+
+        while total < size and not self.exhausted:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                self.exhausted = True
+                break
+
+            line = self.format_row(row)
+
+            lines.append(line)
+            total += len(line)
+
+            self.total_rows += 1
+
+        self.buffer = ''.join(lines)
+
+    def read(self, size=-1):
+        """
+        Return up to 'size' bytes of COPY data. Empty string means end of data.
+
+        Args:
+            size(int): Maximum bytes to return (negative means the buffer size).
+
+        Returns:
+            (str): COPY data.
+
+        """
+
+        if size is None or size < 0:
+            size = self.buffer_size
+
+        if len(self.buffer) < size:
+            self.fill(size)
+
+        data = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+
+        return data
+
+    def readline(self, size=-1):
+        """
+        Return a single COPY line.
+
+        Returns:
+            (str): COPY line.
+
+        """
+
+        if '\n' not in self.buffer:
+            self.fill(len(self.buffer) + 1)
+
+        position = self.buffer.find('\n')
+
+        if position < 0:
+            data = self.buffer
+            self.buffer = ''
+        else:
+            data = self.buffer[:position + 1]
+            self.buffer = self.buffer[position + 1:]
+
+        return data
+
+
+class PrefetchCopyStream(CopyStream):
+    """
+    CopyStream that formats the rows in a background thread.
+
+    The rows keep being generated while the database driver is sending the previous
+    chunks. At most 'depth' chunks of 'buffer_size' bytes wait in memory.
+
+    """
+
+    def __init__(self, rows=None, buffer_size=1048576, escape=True, depth=8):
+
+        CopyStream.__init__(self, rows, buffer_size, escape)
+
+        self.chunks = queue.Queue(maxsize=depth)
+        self.error = None
+        self.stopped = False
+
+        # Data already received from the background thread.
+        self.pending = ''
+        self.finished = False
+
+        self.producer = threading.Thread(target=self.produce)
+        self.producer.daemon = True
+        self.producer.start()
+
+    def produce(self):
+        """
+        Format rows into chunks until there's no more rows (background thread).
+
+        """
+
+        try:
+            while not self.exhausted and not self.stopped:
+                CopyStream.fill(self, self.buffer_size)
+
+                chunk = self.buffer
+                self.buffer = ''
+
+                if chunk:
+                    self.put(chunk)
+
+        except Exception as error:
+            self.error = error
+
+        # End of data.
+        self.put(None)
+
+    def put(self, chunk=None):
+        """
+        Put a chunk into the queue, giving up if the stream was closed.
+
+        Args:
+            chunk(str): COPY data (None means end of data).
+
+        """
+
+        while not self.stopped:
+            try:
+                self.chunks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def receive(self):
+        """
+        Wait for the next chunk from the background thread.
+
+        """
+
+        chunk = self.chunks.get()
+
+        if chunk is None:
+            self.finished = True
+
+            if self.error:
+                raise self.error
+        else:
+            self.pending += chunk
+
+    def read(self, size=-1):
+        """
+        Return up to 'size' bytes of COPY data. Empty string means end of data.
+
+        Args:
+            size(int): Maximum bytes to return (negative means the buffer size).
+
+        Returns:
+            (str): COPY data.
+
+        """
+
+        if size is None or size < 0:
+            size = self.buffer_size
+
+        while len(self.pending) < size and not self.finished:
+            self.receive()
+
+        data = self.pending[:size]
+        self.pending = self.pending[size:]
+
+        return data
+
+    def readline(self, size=-1):
+        """
+        Return a single COPY line.
+
+        Returns:
+            (str): COPY line.
+
+        """
+
+        while '\n' not in self.pending and not self.finished:
+            self.receive()
+
+        position = self.pending.find('\n')
+
+        if position < 0:
+            data = self.pending
+            self.pending = ''
+        else:
+            data = self.pending[:position + 1]
+            self.pending = self.pending[position + 1:]
+
+        return data
+
+    def close(self):
+        """
+        Stop the background thread.
+
+        """
+
+        self.stopped = True
@@ -0,0 +1,82 @@
+from sqlalchemy import text
+
+
+class IdAllocator:
+    """
+    Reserve blocks of 'clusters' ids and identifications in the relational database.
+
+    The last reserved values are kept in the 'cluster_id_allocations' table. Reserving a
+    block is a single UPDATE (row locked until commit), so loaders running at the same time
+    never get the same values. The table is seeded only once from the 'clusters' table.
+
+    Every loader writing into 'clusters' must reserve its values here. A loader that still
+    uses SELECT max(...) doesn't know about the blocks reserved by the others.
+
+    """
+
+    # Any constant, only used to serialize the table creation between loaders.
+    lock_key = 4242001
+
+    def __init__(self, engine=None):
+
+        # Reservations are committed on its own connection, never inside the loading transaction.
+        self.engine = engine
+
+        self.initialized = False
+
+    def initialize(self):
+        """
+        Create and seed the allocations table if it doesn't exist yet.
+
+        """
+
+        if self.initialized:
+            return
+
+        with self.engine.begin() as connection:
+
+            connection.execute(text('SELECT pg_advisory_xact_lock(:key)'), key=self.lock_key)
+
+            connection.execute(text(
+                'CREATE TABLE IF NOT EXISTS cluster_id_allocations ('
+                'name varchar PRIMARY KEY, '
+                'last_value bigint NOT NULL)'))
+
+            for name in ['id', 'identification']:
+                connection.execute(text(
+                    'INSERT INTO cluster_id_allocations (name, last_value) '
+                    'SELECT :name, coalesce(max(' + name + '), 0) FROM clusters '
+                    'WHERE NOT EXISTS '
+                    '(SELECT 1 FROM cluster_id_allocations WHERE name = :name)'),
+                    name=name)
+
+        self.initialized = True
+
+    def reserve(self, name=None, total=None):
+        """
+        Reserve a block of values.
+
+        Args:
+            name(str): 'id' or 'identification'.
+            total(int): How many values to reserve.
+
+        Returns:
+            (int): First value of the reserved block.
+
+        """
+
+        self.initialize()
+
+        with self.engine.begin() as connection:
+
+            result = connection.execute(text(
+                'UPDATE cluster_id_allocations '
+                'SET last_value = last_value + :total '
+                'WHERE name = :name '
+                'RETURNING last_value'),
+                name=name,
+                total=total)
+
+            last_value = result.scalar()
+
+        return last_value - total + 1
@@ -0,0 +1,172 @@
+import os
+import gzip
+import shutil
+
+
+class InsertFile:
+    """
+    Insert file opened for writing, with a large write buffer.
+
+    Every position is a checkpoint: the manifest can record the file size after any
+    result file (see InsertManifest).
+
+    """
+
+    def __init__(self, file_path=None, mode='ab', buffer_size=16777216):
+
+        self.file_path = file_path
+        self.raw = open(file_path, mode, buffer_size)
+
+        # Appending: tell() starts at the end of the file.
+        self.raw.seek(0, os.SEEK_END)
+
+    def write(self, data=None):
+        """
+        Write data to the insert file.
+
+        Args:
+            data(str): Data.
+
+        """
+
+        self.raw.write(data)
+
+    def tell(self):
+        """
+        Return the insert file size (only right after a checkpoint).
+
+        Returns:
+            (int): File size.
+
+        """
+
+        return self.raw.tell()
+
+    def checkpoint_due(self):
+        """
+        Check if the data written so far should be checkpointed now.
+
+        Returns:
+            (boolean): True or False.
+
+        """
+
+        return True
+
+    def checkpoint(self):
+        """
+        Make everything written so far safe to be truncated after (see tell).
+
+        """
+
+        self.raw.flush()
+
+    def append_file(self, file_path=None):
+        """
+        Append another insert file (already in the same format) as it is.
+
+        Args:
+            file_path(str): Insert file (or part) path.
+
+        """
+
+        self.checkpoint()
+
+        with open(file_path, 'rb') as f:
+            shutil.copyfileobj(f, self.raw, 16777216)
+
+    def close(self):
+        """
+        Close the insert file.
+
+        """
+
+        self.checkpoint()
+        self.raw.close()
+
+
+class GzipInsertFile(InsertFile):
+    """
+    Gzip compressed insert file, made of a sequence of independent gzip members.
+
+    A member is closed every 'member_size' uncompressed bytes. Only the end of a member is
+    a checkpoint: the file can be truncated there and more members appended later.
+    Concatenated members are a valid gzip file (gzip -dc, Python gzip module).
+
+    """
+
+    def __init__(self, file_path=None, mode='ab', buffer_size=16777216, compresslevel=6, member_size=67108864):
+
+        InsertFile.__init__(self, file_path, mode, buffer_size)
+
+        self.compresslevel = compresslevel
+        self.member_size = member_size
+
+        self.member = None
+        self.member_bytes = 0
+
+        # Small writes (rows) are joined before going to the compressor.
+        self.pending = []
+        self.pending_bytes = 0
+
+    def write(self, data=None):
+        """
+        Write (compress) data to the insert file.
+
+        Args:
+            data(str): Data.
+
+        """
+
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+
+        if self.pending_bytes >= 1048576:
+            self.compress()
+
+    def compress(self):
+        """
+        Send the pending data to the compressor.
+
+        """
+
+        if not self.pending:
+            return
+
+        if not self.member:
+            self.member = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=self.compresslevel)
+
+        self.member.write(b''.join(self.pending))
+
+        self.member_bytes += self.pending_bytes
+
+        self.pending = []
+        self.pending_bytes = 0
+
+    def checkpoint_due(self):
+        """
+        Check if the current gzip member is big enough to be closed.
+
+        Returns:
+            (boolean): True or False.
+
+        """
+
+        return self.member_bytes + self.pending_bytes >= self.member_size
+
+    def checkpoint(self):
+        """
+        Close the current gzip member.
+
+        """
+
+        self.compress()
+
+        if self.member:
+            # Closes only the member (gzip trailer), not the file.
+            self.member.close()
+
+            self.member = None
+            self.member_bytes = 0
+
+        self.raw.flush()
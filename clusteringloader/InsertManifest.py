@@ -0,0 +1,341 @@
+import os
+import json
+
+
+class InsertManifest:
+    """
+    Checkpoint manifest of the insert file generation.
+
+    The insert file is written to a temporary file. Every result file completely processed
+    is recorded in the manifest (one JSON document per line): size, modification time,
+    total of lines, total of rows, cluster ids and identification and the temporary file
+    size right after its rows. Only when everything is done the temporary file is renamed to
+    the insert file.
+
+    After a crash the manifest tells which result files don't need to be processed again.
+
+    The insert file may be split into shards (insert file + '.<shard>'), each one with its
+    own temporary file. The suffix (like '.gz') goes after the shard number.
+
+    """
+
+    def __init__(self, insert_file=None, shards=1, suffix=''):
+
+        self.insert_file = insert_file + suffix
+        self.manifest_file = insert_file + '.manifest'
+
+        self.shards = shards
+
+        if shards > 1:
+            self.insert_files = [insert_file + '.' + str(shard) + suffix for shard in range(shards)]
+        else:
+            self.insert_files = [insert_file + suffix]
+
+        self.temporary_files = [file_path + '.tmp' for file_path in self.insert_files]
+
+        # Single insert file.
+        self.temporary_file = self.temporary_files[0]
+
+        self.header = None
+        self.entries = []
+        self.finished = False
+
+        # Manifest file kept open for appending.
+        self.handle = None
+
+    def start(self, header=None):
+        """
+        Start a new manifest, removing any previous temporary file and manifest.
+
+        Args:
+            header(dict): Generation parameters (label, first ids etc).
+
+        """
+
+        self.close()
+
+        for file_path in self.temporary_files + [self.manifest_file]:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+        self.header = header
+        self.entries = []
+        self.finished = False
+
+        self.write_line(header)
+
+    def read(self):
+        """
+        Read the manifest file.
+
+        Returns:
+            (boolean): True if there's a manifest with a header.
+
+        """
+
+        self.close()
+
+        self.header = None
+        self.entries = []
+        self.finished = False
+
+        if not os.path.exists(self.manifest_file):
+            return False
+
+        with open(self.manifest_file) as f:
+
+            for line in f:
+
+                # The last line may be incomplete (crash while writing it).
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+
+                if self.header is None:
+                    self.header = record
+                elif record.get('done'):
+                    self.finished = True
+                else:
+                    self.entries.append(record)
+
+        return self.header is not None
+
+    def is_unchanged(self, entry=None):
+        """
+        Check if the result file is still the same file recorded in the manifest.
+
+        Args:
+            entry(dict): Manifest entry.
+
+        Returns:
+            (boolean): True or False.
+
+        """
+
+        try:
+            stat = os.stat(entry['file'])
+        except OSError:
+            return False
+
+        return stat.st_size == entry['size'] and stat.st_mtime == entry['mtime']
+
+    def resume(self, header=None):
+        """
+        Reuse a previous manifest if it was generated with the same parameters.
+
+        Only the entries until the first changed result file are kept and the temporary
+        file is truncated right after the rows of the last kept entry.
+
+        Args:
+            header(dict): Generation parameters (label etc) that must match the manifest ones.
+
+        Returns:
+            (boolean): True if the previous generation can be resumed.
+
+        """
+
+        if not self.read():
+            return False
+
+        for key, value in header.iteritems():
+            if self.header.get(key) != value:
+                return False
+
+        if self.finished:
+            if all([os.path.exists(file_path) for file_path in self.insert_files]):
+                return True
+
+            self.finished = False
+
+        entries = []
+
+        for entry in self.entries:
+            if not self.is_unchanged(entry):
+                break
+
+            entries.append(entry)
+
+        self.entries = entries
+
+        # Temporary file size after the last kept entry of each shard.
+        offsets = [0] * self.shards
+
+        for entry in entries:
+            if entry.get('offset') is not None:
+                offsets[entry.get('shard', 0)] = entry['offset']
+
+        for temporary_file, offset in zip(self.temporary_files, offsets):
+
+            if offset:
+                # The rows of the kept entries are gone. Nothing to resume.
+                if not os.path.exists(temporary_file) or os.path.getsize(temporary_file) < offset:
+                    return False
+
+        for temporary_file, offset in zip(self.temporary_files, offsets):
+
+            if os.path.exists(temporary_file):
+                with open(temporary_file, 'r+b') as f:
+                    f.truncate(offset)
+
+        self.rewrite()
+
+        return True
+
+    def rewrite(self):
+        """
+        Atomically rewrite the manifest file with the header and the current entries.
+
+        """
+
+        self.close()
+
+        with open(self.manifest_file + '.tmp', 'w') as f:
+            f.write(json.dumps(self.header) + '\n')
+
+            for entry in self.entries:
+                f.write(json.dumps(entry) + '\n')
+
+        os.rename(self.manifest_file + '.tmp', self.manifest_file)
+
+    def keep(self, file_paths=None):
+        """
+        Keep only the entries of the given result files (the other ones will be processed again).
+
+        Args:
+            file_paths(set): Result file paths.
+
+        """
+
+        self.entries = [entry for entry in self.entries if entry['file'] in file_paths]
+
+        self.rewrite()
+
+    def write_line(self, record=None):
+        """
+        Append a record to the manifest file.
+
+        Args:
+            record(dict): Record.
+
+        """
+
+        if not self.handle:
+            self.handle = open(self.manifest_file, 'a')
+
+        self.handle.write(json.dumps(record) + '\n')
+        self.handle.flush()
+
+    def close(self):
+        """
+        Close the manifest file.
+
+        """
+
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+    def add(self, file_path=None, lines=None, rows=None, first_id=None, identification=None, offset=None, shard=0):
+        """
+        Record a completely processed result file.
+
+        Args:
+            file_path(str): Result file path.
+            lines(int): Total of lines (cluster ids used).
+            rows(int): Total of rows written.
+            first_id(int): First cluster id used.
+            identification(int): Cluster identification used.
+            offset(int): Temporary file size after the rows of this file (None if written elsewhere).
+            shard(int): Shard where the rows were written.
+
+        """
+
+        stat = os.stat(file_path)
+
+        entry = {
+            'file': file_path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'lines': lines,
+            'rows': rows,
+            'first_id': first_id,
+            'last_id': first_id + lines - 1,
+            'identification': identification,
+            'offset': offset,
+            'shard': shard}
+
+        self.entries.append(entry)
+
+        self.write_line(entry)
+
+    def processed_files(self):
+        """
+        Return the result files already processed.
+
+        Returns:
+            (set): Result file paths.
+
+        """
+
+        return set([entry['file'] for entry in self.entries])
+
+    def id_range(self):
+        """
+        Return the first and the last cluster ids used by the generation (read from the manifest file).
+
+        Returns:
+            (tuple): First and last cluster ids, None if no result file was processed.
+
+        """
+
+        if not self.read() or not self.entries:
+            return None
+
+        return min([entry['first_id'] for entry in self.entries]), max([entry['last_id'] for entry in self.entries])
+
+    def overlapping_entries(self):
+        """
+        Return the first two entries whose cluster id ranges overlap (the same ids written twice).
+
+        Returns:
+            (tuple): Two entries, None if every id is used only once.
+
+        """
+
+        previous = None
+
+        for entry in sorted(self.entries, key=lambda entry: entry['first_id']):
+            if previous and entry['first_id'] <= previous['last_id']:
+                return previous, entry
+
+            previous = entry
+
+        return None
+
+    def finish(self):
+        """
+        Mark the generation as done and atomically rename the temporary files to the insert files.
+
+        """
+
+        # Never publish an insert file with duplicate ids (the temporary files are kept).
+        overlapping = self.overlapping_entries()
+
+        if overlapping:
+            raise RuntimeError(
+                'Cluster ids of ' + overlapping[0]['file'] + ' and ' + overlapping[1]['file'] + ' overlap: ' +
+                self.insert_file + ' was not generated.')
+
+        # Done first: a crash before the rename is resumed without processing anything again.
+        self.write_line({'done': True})
+        self.close()
+
+        for temporary_file, insert_file in zip(self.temporary_files, self.insert_files):
+            # Shards may have no rows at all.
+            if not os.path.exists(temporary_file):
+                open(temporary_file, 'w').close()
+
+            os.rename(temporary_file, insert_file)
+
+        self.finished = True
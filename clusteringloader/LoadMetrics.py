@@ -0,0 +1,267 @@
+import os
+import json
+import time
+
+
+class LoadMetrics:
+    """
+    Counters and per stage timing of a load, with periodic progress and ETA.
+
+    Counters: files, lines, rows (written), unresolved (identifications not found),
+    db_round_trips (lookup queries), bytes_read, bytes_skipped (result files already
+    processed by a resumed generation), bytes_written and rows_loaded.
+
+    The ETA comes from the total size of the result files and the bytes read so far in the
+    current stage. Every progress report also writes a snapshot file: JSON or, if the file
+    name ends with '.prom', the Prometheus textfile format.
+
+    """
+
+    counter_names = [
+        'files',
+        'lines',
+        'rows',
+        'unresolved',
+        'db_round_trips',
+        'bytes_read',
+        'bytes_skipped',
+        'bytes_written',
+        'rows_loaded']
+
+    def __init__(self, log=None, metrics_file=None, interval=60):
+
+        self.log = log
+
+        # Snapshot file (None means no snapshot).
+        self.metrics_file = metrics_file
+
+        # Seconds between progress reports.
+        self.interval = interval
+
+        self.counters = dict([(name, 0) for name in self.counter_names])
+
+        # Total size of the result files to be read (for the ETA).
+        self.total_bytes = 0
+
+        # Stage name -> elapsed seconds (finished stages).
+        self.stages = {}
+
+        self.stage = None
+        self.stage_start = None
+        self.stage_counters = None
+
+        self.last_report = time.time()
+
+    def add(self, name=None, value=1):
+        """
+        Increment a counter.
+
+        Args:
+            name(str): Counter name.
+            value(int): Increment.
+
+        """
+
+        self.counters[name] += value
+
+    def set(self, name=None, value=0):
+        """
+        Set a counter (for totals measured elsewhere, like file sizes).
+
+        Args:
+            name(str): Counter name.
+            value(int): Value.
+
+        """
+
+        self.counters[name] = value
+
+    def start_stage(self, stage=None, total_bytes=None):
+        """
+        Start timing a stage.
+
+        Args:
+            stage(str): Stage name.
+            total_bytes(int): Total of bytes to be read by the stage (for the ETA).
+
+        """
+
+        self.stage = stage
+        self.stage_start = time.time()
+        self.stage_counters = dict(self.counters)
+
+        if total_bytes is not None:
+            self.total_bytes = total_bytes
+
+        self.last_report = self.stage_start
+
+    def finish_stage(self):
+        """
+        Finish the current stage, log its time, report its progress and write the snapshot.
+
+        """
+
+        if not self.stage:
+            return
+
+        self.stages[self.stage] = time.time() - self.stage_start
+
+        # Stages that don't read result files (validate, preload) have no progress to report.
+        if self.counters['files'] != self.stage_counters['files']:
+            self.report()
+        else:
+            self.write()
+
+        self.log.info('Stage: ' + str(self.stage) + ' took ' + str(round(self.stages[self.stage], 3)) + 's.')
+
+        self.stage = None
+
+    def rates(self):
+        """
+        Return the current stage rates and ETA.
+
+        Returns:
+            (dict): Elapsed seconds, rows/s, bytes/s and ETA (seconds, None if unknown).
+
+        """
+
+        if not self.stage:
+            return {'elapsed': 0, 'rows_per_second': None, 'bytes_per_second': None, 'eta': None}
+
+        elapsed = time.time() - self.stage_start
+
+        rows = self.counters['rows'] - self.stage_counters['rows']
+        bytes_read = self.counters['bytes_read'] - self.stage_counters['bytes_read']
+
+        rows_per_second = None
+        bytes_per_second = None
+        eta = None
+
+        if elapsed > 0:
+            rows_per_second = rows / elapsed
+            bytes_per_second = bytes_read / elapsed
+
+        remaining = self.total_bytes - self.counters['bytes_read'] - self.counters['bytes_skipped']
+
+        if bytes_per_second:
+            eta = max(0, remaining) / bytes_per_second
+
+        return {
+            'elapsed': elapsed,
+            'rows_per_second': rows_per_second,
+            'bytes_per_second': bytes_per_second,
+            'eta': eta}
+
+    def progress(self):
+        """
+        Report the progress if the interval has passed since the last report.
+
+        """
+
+        if time.time() - self.last_report >= self.interval:
+            self.report()
+
+    def report(self):
+        """
+        Log the progress (rows/s and ETA) and write the snapshot file.
+
+        """
+
+        self.last_report = time.time()
+
+        rates = self.rates()
+
+        done = self.counters['bytes_read'] + self.counters['bytes_skipped']
+
+        message = 'Progress: ' + str(self.stage) + ': ' + \
+            str(self.counters['files']) + ' files, ' + \
+            str(self.counters['rows']) + ' rows, ' + \
+            str(self.counters['unresolved']) + ' unresolved'
+
+        if self.total_bytes:
+            message += ', ' + str(round(100.0 * done / self.total_bytes, 1)) + '% read'
+
+        if rates['rows_per_second'] is not None:
+            message += ', ' + str(int(rates['rows_per_second'])) + ' rows/s'
+
+        if rates['eta'] is not None:
+            message += ', ETA ' + str(int(rates['eta'])) + 's'
+
+        self.log.info(message + '.')
+
+        self.write()
+
+    def snapshot(self):
+        """
+        Return all the metrics.
+
+        Returns:
+            (dict): Counters, total bytes, stage times, current stage and rates.
+
+        """
+
+        return {
+            'time': time.time(),
+            'counters': dict(self.counters),
+            'total_bytes': self.total_bytes,
+            'stages': dict(self.stages),
+            'stage': self.stage,
+            'rates': self.rates()}
+
+    def prometheus(self, snapshot=None):
+        """
+        Format a snapshot in the Prometheus textfile format.
+
+        Args:
+            snapshot(dict): Metrics (see snapshot).
+
+        Returns:
+            (str): Prometheus metrics.
+
+        """
+
+        lines = []
+
+        for name in self.counter_names:
+            lines.append('# TYPE clusteringloader_' + name + ' counter')
+            lines.append('clusteringloader_' + name + ' ' + str(snapshot['counters'][name]))
+
+        lines.append('# TYPE clusteringloader_total_bytes gauge')
+        lines.append('clusteringloader_total_bytes ' + str(snapshot['total_bytes']))
+
+        lines.append('# TYPE clusteringloader_stage_seconds gauge')
+
+        for stage, seconds in sorted(snapshot['stages'].items()):
+            lines.append('clusteringloader_stage_seconds{stage="' + stage + '"} ' + repr(seconds))
+
+        for name in ['rows_per_second', 'eta']:
+            if snapshot['rates'][name] is not None:
+                lines.append('# TYPE clusteringloader_' + name + ' gauge')
+                lines.append('clusteringloader_' + name + ' ' + repr(snapshot['rates'][name]))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Write (atomically) the snapshot file.
+
+        """
+
+        if not self.metrics_file:
+            return
+
+        snapshot = self.snapshot()
+
+        temporary_file = self.metrics_file + '.tmp'
+
+        try:
+            with open(temporary_file, 'w') as f:
+                if self.metrics_file.endswith('.prom'):
+                    f.write(self.prometheus(snapshot))
+                else:
+                    json.dump(snapshot, f, indent=2, sort_keys=True)
+
+            os.rename(temporary_file, self.metrics_file)
+
+        except (IOError, OSError) as e:
+            self.log.info('-- ERROR -- Metrics file: ' + str(self.metrics_file) + ' could not be written: ' + str(e))
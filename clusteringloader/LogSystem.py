@@ -0,0 +1,262 @@
+import sys
+import atexit
+import logging
+import threading
+import multiprocessing
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+class QueueHandler(logging.Handler):
+    """
+    Logging handler that only puts the records into a queue.
+
+    The record is not formatted here: the listener thread does that (same process, so
+    the record doesn't need to be pickled). In a process pool worker the queue is a
+    multiprocessing queue: only the message goes to the main process (see route_worker_records).
+
+    """
+
+    def __init__(self, queue=None):
+
+        logging.Handler.__init__(self)
+
+        self.queue = queue
+
+        # The records are pickled (multiprocessing queue).
+        self.pickled = False
+
+    def prepare(self, record=None):
+        """
+        Make a record picklable: the message (and traceback) is merged, arguments are dropped.
+
+        Args:
+            record(LogRecord): Log record.
+
+        Returns:
+            (LogRecord): The same record.
+
+        """
+
+        message = record.getMessage()
+
+        if record.exc_info:
+            message += '\n' + logging.Formatter().formatException(record.exc_info)
+
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+
+        return record
+
+    def emit(self, record=None):
+
+        try:
+            if self.pickled:
+                record = self.prepare(record)
+
+            self.queue.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener:
+    """
+    Background thread that takes the records from the queue and sends them to the real handlers.
+
+    """
+
+    sentinel = None
+
+    def __init__(self, queue=None, handlers=None):
+
+        self.queue = queue
+        self.handlers = handlers or []
+        self.thread = None
+
+    def start(self):
+        """
+        Start the listener thread.
+
+        """
+
+        self.thread = threading.Thread(target=self.monitor)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def monitor(self):
+        """
+        Handle the queued records until the sentinel.
+
+        """
+
+        while True:
+            record = self.queue.get()
+
+            if record is self.sentinel:
+                break
+
+            for handler in list(self.handlers):
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+    def stop(self):
+        """
+        Handle all the records already queued and stop the listener thread.
+
+        """
+
+        if self.thread:
+            self.queue.put(self.sentinel)
+            self.thread.join()
+            self.thread = None
+
+
+class LogSystem:
+    """
+    Route the root logger through a queue to a background listener (stdout and log files).
+
+    The loader thread only puts records into the queue: formatting and I/O happen in the
+    listener thread. Configuring it again (another loader in the same process) doesn't
+    add duplicated handlers: stdout once, each log file once.
+
+    The queue is drained when the process exits.
+
+    """
+
+    format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+    def __init__(self):
+
+        self.queue = Queue(-1)
+
+        self.queue_handler = QueueHandler(self.queue)
+
+        # Handler key ('stdout' or log file path) -> handler.
+        self.handlers = {}
+
+        self.listener = None
+
+        # Listeners of the process pool workers records (queue id -> listener).
+        self.worker_listeners = {}
+
+    def add_handler(self, key=None, handler=None):
+        """
+        Add a handler to the listener (only once per key).
+
+        Args:
+            key(str): Handler key.
+            handler(Handler): Logging handler.
+
+        """
+
+        if key in self.handlers:
+            return
+
+        handler.setFormatter(logging.Formatter(self.format))
+
+        self.handlers[key] = handler
+
+        if self.listener:
+            self.listener.handlers = list(self.handlers.values())
+
+    def configure(self, log_file=None, level=logging.INFO):
+        """
+        Route the root logger through the queue to stdout and the log file.
+
+        Args:
+            log_file(str): Full path for the log file.
+            level(int): Root logger level.
+
+        Returns:
+            (Logger): The root logger.
+
+        """
+
+        log = logging.getLogger('')
+        log.setLevel(level)
+
+        self.add_handler('stdout', logging.StreamHandler(sys.stdout))
+
+        if log_file:
+            self.add_handler(log_file, logging.FileHandler(log_file))
+
+        if self.queue_handler not in log.handlers:
+            log.addHandler(self.queue_handler)
+
+        if not self.listener:
+            self.listener = QueueListener(self.queue, list(self.handlers.values()))
+            self.listener.start()
+
+            atexit.register(self.stop)
+
+        return log
+
+    def stop(self):
+        """
+        Write every queued record and stop the listener.
+
+        """
+
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
+        for handler in self.handlers.values():
+            handler.flush()
+
+    def start_worker_queue(self):
+        """
+        Start a listener for the records of process pool workers (see route_worker_records).
+
+        The workers are forked: the queue of the main process has no listener there.
+
+        Returns:
+            (Queue): multiprocessing queue, given to the workers by the pool initializer.
+
+        """
+
+        queue = multiprocessing.Queue(-1)
+
+        listener = QueueListener(queue, list(self.handlers.values()))
+        listener.start()
+
+        self.worker_listeners[id(queue)] = listener
+
+        return queue
+
+    def stop_worker_queue(self, queue=None):
+        """
+        Write the records of the workers (the pool was already joined) and stop its listener.
+
+        Args:
+            queue(Queue): Queue returned by start_worker_queue.
+
+        """
+
+        listener = self.worker_listeners.pop(id(queue), None)
+
+        if listener:
+            listener.stop()
+
+
+# One log system per process.
+log_system = LogSystem()
+
+
+def route_worker_records(queue=None):
+    """
+    Send the log records of a process pool worker to the main process (pool initializer).
+
+    Args:
+        queue(Queue): Queue returned by LogSystem.start_worker_queue.
+
+    """
+
+    log_system.queue_handler.queue = queue
+    log_system.queue_handler.pickled = True
+
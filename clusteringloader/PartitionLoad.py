@@ -0,0 +1,204 @@
+import re
+import time
+from sqlalchemy import text
+
+
+class PartitionLoad:
+    """
+    Load the rows of a clustering method as a new partition of a table partitioned by
+    LIST (clustering_method_id).
+
+    The rows are copied into a standalone table (with FREEZE when it's created by the same
+    transaction as the COPY), its indexes are built and then it's attached as the partition
+    of the clustering method. A partition already attached for the clustering method is
+    detached and dropped by the same transaction: replacing a whole run never rewrites the
+    other partitions, and neither do the bigger and bigger indexes.
+
+    """
+
+    def __init__(self, session=None, table='clusters', clustering_method_id=None):
+
+        self.session = session
+        self.table = table
+        self.clustering_method_id = clustering_method_id
+
+        # Every load gets its own table name: the index names (generated from it) never
+        # clash with the ones of the partition being replaced.
+        self.new_table = table + '_' + str(clustering_method_id) + '_' + time.strftime('%Y%m%d%H%M%S')
+
+        # Name of the partition that was replaced by attach() (None if there was none).
+        self.replaced = None
+
+    def is_partitioned(self):
+        """
+        Check if the table is partitioned.
+
+        Returns:
+            (boolean): True or False.
+
+        """
+
+        # relkind 'p' (partitioned table) also works on servers without partitioning.
+        result = self.session.execute(text(
+            'SELECT relkind FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+            {'table': self.table})
+
+        return result.scalar() == 'p'
+
+    def existing_partition(self):
+        """
+        Return the partition attached for the clustering method.
+
+        Returns:
+            (str): Partition name or None.
+
+        """
+
+        result = self.session.execute(text(
+            'SELECT quote_ident(c.relname) '
+            'FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = CAST(:table AS regclass) '
+            'AND pg_get_expr(c.relpartbound, c.oid) = :bound'),
+            {'table': self.table, 'bound': 'FOR VALUES IN (' + str(int(self.clustering_method_id)) + ')'})
+
+        return result.scalar()
+
+    def create_statement(self):
+        """
+        Return the statement that creates the (empty) table to be loaded.
+
+        Returns:
+            (str): CREATE TABLE statement.
+
+        """
+
+        return 'CREATE TABLE ' + self.new_table + ' (LIKE ' + self.table + ' INCLUDING DEFAULTS)'
+
+    def prepare(self, create=True):
+        """
+        Get the table to be loaded ready.
+
+        Args:
+            create(boolean): Create it now. False if the COPY transaction creates it (COPY FREEZE).
+
+        """
+
+        self.session.execute(text('DROP TABLE IF EXISTS ' + self.new_table))
+
+        if create:
+            self.session.execute(text(self.create_statement()))
+
+        self.session.commit()
+
+    def index_statements(self):
+        """
+        Return the statements that build on the loaded table the indexes and unique
+        constraints of the partitioned table (attached to them by ATTACH PARTITION).
+
+        Returns:
+            (list): CREATE INDEX and ALTER TABLE ... ADD statements.
+
+        """
+
+        result = self.session.execute(text(
+            'SELECT pg_get_indexdef(x.indexrelid), pg_get_constraintdef(c.oid) '
+            'FROM pg_index x '
+            'LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid '
+            'WHERE x.indrelid = CAST(:table AS regclass) '
+            'ORDER BY x.indexrelid'),
+            {'table': self.table})
+
+        statements = []
+
+        for index_definition, constraint_definition in result:
+
+            # Primary keys and unique constraints: a plain unique index isn't attached to them.
+            if constraint_definition:
+                statements.append('ALTER TABLE ' + self.new_table + ' ADD ' + constraint_definition)
+
+                continue
+
+            # 'CREATE INDEX name ON ONLY public.clusters USING ...': no name, so it's generated.
+            statements.append(re.sub(
+                r'^CREATE (UNIQUE )?INDEX \S+ ON (ONLY )?\S+ ',
+                lambda match: 'CREATE ' + (match.group(1) or '') + 'INDEX ON ' + self.new_table + ' ',
+                index_definition))
+
+        return statements
+
+    def attach(self):
+        """
+        Build the indexes of the loaded table and attach it as the partition of the
+        clustering method, replacing (detach and drop) the previous one.
+
+        Returns:
+            (str): Name of the replaced partition or None.
+
+        """
+
+        try:
+            for statement in self.index_statements():
+                self.session.execute(text(statement))
+
+            # Matches the partition bound: ATTACH PARTITION doesn't need to scan the rows.
+            self.session.execute(text(
+                'ALTER TABLE ' + self.new_table + ' ADD CONSTRAINT ' + self.new_table + '_bound '
+                'CHECK (clustering_method_id IS NOT NULL AND clustering_method_id = ' +
+                str(int(self.clustering_method_id)) + ')'))
+
+            self.session.execute(text('ANALYZE ' + self.new_table))
+
+            self.session.commit()
+
+            self.replaced = self.existing_partition()
+
+            if self.replaced:
+                self.session.execute(text('ALTER TABLE ' + self.table + ' DETACH PARTITION ' + self.replaced))
+                self.session.execute(text('DROP TABLE ' + self.replaced))
+
+            self.session.execute(text(
+                'ALTER TABLE ' + self.table + ' ATTACH PARTITION ' + self.new_table +
+                ' FOR VALUES IN (' + str(int(self.clustering_method_id)) + ')'))
+
+            self.session.execute(text('ALTER TABLE ' + self.new_table + ' DROP CONSTRAINT ' + self.new_table + '_bound'))
+
+            self.session.commit()
+
+        except Exception:
+            # The partition of the clustering method (if any) is still attached.
+            self.discard()
+            raise
+
+        return self.replaced
+
+    def discard(self):
+        """
+        Drop the loaded table (failed load): the partitioned table is left untouched.
+
+        """
+
+        self.session.rollback()
+
+        self.session.execute(text('DROP TABLE IF EXISTS ' + self.new_table))
+
+        self.session.commit()
+
+    def drop(self):
+        """
+        Remove all the rows of the clustering method: detach and drop its partition.
+
+        Returns:
+            (str): Name of the dropped partition or None.
+
+        """
+
+        partition = self.existing_partition()
+
+        if partition:
+            self.session.execute(text('ALTER TABLE ' + self.table + ' DETACH PARTITION ' + partition))
+            self.session.execute(text('DROP TABLE ' + partition))
+
+            self.session.commit()
+
+        return partition
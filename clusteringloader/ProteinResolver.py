@@ -0,0 +1,208 @@
+import sys
+import bisect
+from array import array
+from sqlalchemy import text, select
+from Connection import *
+from Ec import *
+from Protein import *
+
+
+class ProteinResolver:
+    """
+    Resolve protein identifications and EC numbers to relational database ids locally.
+
+    The whole 'proteins' (identification, id) and 'ecs' (ec, id) pairs are streamed once
+    from the relational database and kept as a sorted list of identifications plus a
+    parallel integer array of ids. Every lookup is a binary search, no database round trip.
+
+    """
+
+    def __init__(self, protein_keys=None, protein_ids=None, ec_ids=None):
+
+        # Sorted protein identifications and its ids (same positions).
+        self.protein_keys = protein_keys if protein_keys is not None else []
+        self.protein_ids = protein_ids if protein_ids is not None else array('l')
+
+        # EC numbers are just a few thousands. A dict is enough.
+        self.ec_ids = ec_ids if ec_ids is not None else {}
+
+        # Lookup statistics.
+        self.hits = 0
+        self.misses = 0
+        self.ec_hits = 0
+        self.ec_misses = 0
+
+    def preload(self, session=None, batch_size=100000):
+        """
+        Stream all the proteins and EC numbers from the relational database into memory.
+
+        Args:
+            session(Session): SQLAlchemy session.
+            batch_size(int): How many rows to fetch from the database at once.
+
+        """
+
+        protein_keys = []
+        protein_ids = array('l')
+
+        # PostgreSQL sorts using the database collation, that's not the same as the
+        # Python string comparison. The "C" collation is byte order, same as Python.
+        if session.bind.dialect.name == 'postgresql':
+            order = text('identification COLLATE "C"')
+        else:
+            order = Protein.identification
+
+        # Server-side cursor, no ORM objects: only a batch of rows in memory at a time.
+        query = select([Protein.identification, Protein.id]).order_by(order)
+
+        in_order = True
+        previous = None
+
+        for identification, protein_id in stream_rows(session, query, batch_size=batch_size):
+
+            if identification is None:
+                continue
+
+            if previous is not None and identification < previous:
+                in_order = False
+
+            protein_keys.append(identification)
+            protein_ids.append(protein_id)
+
+            previous = identification
+
+        # Database didn't give us the Python order. Sort it here.
+        if not in_order:
+            positions = sorted(range(len(protein_keys)), key=protein_keys.__getitem__)
+            protein_keys = [protein_keys[position] for position in positions]
+            protein_ids = array('l', [protein_ids[position] for position in positions])
+
+        ec_ids = {}
+
+        for ec, ec_id in stream_rows(session, select([Ec.ec, Ec.id]), batch_size=batch_size):
+            if ec not in ec_ids:
+                ec_ids[ec] = ec_id
+
+        self.protein_keys = protein_keys
+        self.protein_ids = protein_ids
+        self.ec_ids = ec_ids
+
+    def protein_id(self, protein_identification=None):
+        """
+        Return the relational database id (table 'proteins') for the protein identification.
+
+        Args:
+            protein_identification(str): Protein identification in the relational database.
+
+        Returns:
+            (int): Protein database id or None if not found.
+
+        """
+
+        keys = self.protein_keys
+
+        position = bisect.bisect_left(keys, protein_identification)
+
+        if position < len(keys) and keys[position] == protein_identification:
+            self.hits += 1
+            return self.protein_ids[position]
+
+        self.misses += 1
+
+    def resolve_protein_ids(self, protein_identifications=None):
+        """
+        Return the relational database ids for many protein identifications at once.
+
+        Args:
+            protein_identifications(list): Protein identifications.
+
+        Returns:
+            (list): Protein database ids (None if not found), same order.
+
+        """
+
+        keys = self.protein_keys
+        ids = self.protein_ids
+        total = len(keys)
+        bisect_left = bisect.bisect_left
+
+        result = []
+
+        for protein_identification in protein_identifications:
+            position = bisect_left(keys, protein_identification)
+
+            if position < total and keys[position] == protein_identification:
+                result.append(ids[position])
+            else:
+                result.append(None)
+
+        misses = result.count(None)
+
+        self.hits += len(result) - misses
+        self.misses += misses
+
+        return result
+
+    def ec_number_id(self, ec_number=None):
+        """
+        Return the relational database id (table 'ecs') for the EC number.
+
+        Args:
+            ec_number(str): EC number.
+
+        Returns:
+            (int): EC number database id or None if not found.
+
+        """
+
+        result = self.ec_ids.get(ec_number)
+
+        if result is None:
+            self.ec_misses += 1
+        else:
+            self.ec_hits += 1
+
+        return result
+
+    def memory_footprint(self):
+        """
+        Return an estimate of the memory used by the resolver data.
+
+        Returns:
+            (int): Total of bytes.
+
+        """
+
+        total = sys.getsizeof(self.protein_keys)
+
+        # Memory-mapped keys (see ResolverSnapshot) are not in the process memory.
+        if isinstance(self.protein_keys, list):
+            for key in self.protein_keys:
+                total += sys.getsizeof(key)
+
+        total += sys.getsizeof(self.protein_ids)
+
+        total += sys.getsizeof(self.ec_ids)
+
+        for ec in self.ec_ids:
+            total += sys.getsizeof(ec)
+
+        return total
+
+    def statistics(self):
+        """
+        Return the resolver statistics: sizes, memory footprint, hits and misses.
+
+        Returns:
+            (dict): Resolver statistics.
+
+        """
+
+        return {
+            'proteins': len(self.protein_keys),
+            'ecs': len(self.ec_ids),
+            'memory_bytes': self.memory_footprint(),
+            'hits': self.hits,
+            'misses': self.misses,
+            'ec_hits': self.ec_hits,
+            'ec_misses': self.ec_misses}
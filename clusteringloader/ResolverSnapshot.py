@@ -0,0 +1,275 @@
+import os
+import json
+import mmap
+import struct
+from sqlalchemy.sql import func
+from Ec import *
+from Protein import *
+from ProteinResolver import *
+
+
+class MappedInts:
+    """
+    Read only sequence of 64 bits integers stored in a memory-mapped file.
+
+    """
+
+    int_struct = struct.Struct('<q')
+
+    def __init__(self, data=None, start=0, length=0):
+
+        self.data = data
+        self.start = start
+        self.length = length
+
+    def __len__(self):
+
+        return self.length
+
+    def __getitem__(self, position):
+
+        if position < 0 or position >= self.length:
+            raise IndexError(position)
+
+        return self.int_struct.unpack_from(self.data, self.start + 8 * position)[0]
+
+
+class MappedKeys:
+    """
+    Read only sequence of sorted strings stored in a memory-mapped file (blob + offsets).
+
+    It can be searched by bisect like a list: only the probed keys are read.
+
+    """
+
+    offset_struct = struct.Struct('<qq')
+
+    # Keys are stored as UTF-8 bytes. Python 3 compares them as text.
+    decode = bytes is not str
+
+    def __init__(self, data=None, offsets_start=0, keys_start=0, length=0):
+
+        self.data = data
+        self.offsets_start = offsets_start
+        self.keys_start = keys_start
+        self.length = length
+
+    def __len__(self):
+
+        return self.length
+
+    def __getitem__(self, position):
+
+        if position < 0 or position >= self.length:
+            raise IndexError(position)
+
+        start, end = self.offset_struct.unpack_from(self.data, self.offsets_start + 8 * position)
+
+        key = self.data[self.keys_start + start:self.keys_start + end]
+
+        if self.decode:
+            return key.decode('utf-8')
+
+        return key
+
+
+class ResolverSnapshot:
+    """
+    Local snapshot of the resolver data ('proteins' identification -> id and 'ecs' ec -> id).
+
+    The snapshot is a single file: a JSON header (fingerprint, EC numbers and sections
+    positions) followed by the protein ids, the keys offsets and the sorted keys. The
+    proteins are memory-mapped, not loaded: lookups are a binary search over the file.
+
+    The fingerprint (rows count and max id of 'proteins' and 'ecs') tells if the database
+    changed since the snapshot was saved. Those tables only change when they're imported again.
+
+    """
+
+    magic = b'CLRSNAP1'
+
+    def __init__(self, snapshot_file=None):
+
+        self.snapshot_file = snapshot_file
+
+        self.handle = None
+        self.data = None
+
+        self.header = None
+
+    def fingerprint(self, session=None):
+        """
+        Return the current fingerprint of the 'proteins' and 'ecs' tables.
+
+        Args:
+            session(Session): SQLAlchemy session.
+
+        Returns:
+            (dict): Rows count and max id of each table.
+
+        """
+
+        proteins, max_protein_id = session.query(func.count(Protein.id), func.max(Protein.id)).one()
+        ecs, max_ec_id = session.query(func.count(Ec.id), func.max(Ec.id)).one()
+
+        return {
+            'proteins': int(proteins),
+            'max_protein_id': max_protein_id,
+            'ecs': int(ecs),
+            'max_ec_id': max_ec_id}
+
+    def read_header(self):
+        """
+        Read the snapshot header.
+
+        Returns:
+            (dict): Header or None if there's no (valid) snapshot file.
+
+        """
+
+        if not self.snapshot_file or not os.path.exists(self.snapshot_file):
+            return None
+
+        with open(self.snapshot_file, 'rb') as f:
+
+            if f.read(len(self.magic)) != self.magic:
+                return None
+
+            try:
+                (header_size,) = struct.unpack('<q', f.read(8))
+
+                return json.loads(f.read(header_size).decode('utf-8'))
+
+            except (struct.error, ValueError):
+                return None
+
+    def matches(self, fingerprint=None):
+        """
+        Check if the snapshot was saved with the same fingerprint.
+
+        Args:
+            fingerprint(dict): Current fingerprint (see fingerprint).
+
+        Returns:
+            (boolean): True or False.
+
+        """
+
+        header = self.read_header()
+
+        return header is not None and header['fingerprint'] == fingerprint
+
+    def open(self):
+        """
+        Memory-map the snapshot and return a resolver that reads from it.
+
+        Returns:
+            (ProteinResolver): Resolver.
+
+        """
+
+        self.close()
+
+        self.header = self.read_header()
+
+        self.handle = open(self.snapshot_file, 'rb')
+        self.data = mmap.mmap(self.handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        proteins = self.header['proteins']
+
+        protein_keys = MappedKeys(self.data, self.header['offsets_start'], self.header['keys_start'], proteins)
+        protein_ids = MappedInts(self.data, self.header['ids_start'], proteins)
+
+        return ProteinResolver(protein_keys, protein_ids, dict(self.header['ecs']))
+
+    def close(self):
+        """
+        Close the memory-mapped snapshot.
+
+        """
+
+        if self.data:
+            self.data.close()
+            self.data = None
+
+        if self.handle:
+            self.handle.close()
+            self.handle = None
+
+    def write_ints(self, f=None, values=None, chunk_size=65536):
+        """
+        Write integers as 64 bits little endian.
+
+        Args:
+            f(file): Destination.
+            values(list): Integers.
+            chunk_size(int): Integers packed at once.
+
+        """
+
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start:start + chunk_size]
+
+            f.write(struct.pack('<' + str(len(chunk)) + 'q', *chunk))
+
+    def save(self, resolver=None, fingerprint=None):
+        """
+        Save (atomically) the resolver data as the snapshot.
+
+        Args:
+            resolver(ProteinResolver): Preloaded resolver.
+            fingerprint(dict): Fingerprint of the tables the resolver was loaded from.
+
+        """
+
+        keys = []
+
+        for key in resolver.protein_keys:
+            if not isinstance(key, bytes):
+                key = key.encode('utf-8')
+
+            keys.append(key)
+
+        offsets = [0]
+
+        for key in keys:
+            offsets.append(offsets[-1] + len(key))
+
+        proteins = len(keys)
+
+        header = {
+            'fingerprint': fingerprint,
+            'proteins': proteins,
+            'ecs': sorted(resolver.ec_ids.items())}
+
+        # Sections positions depend on the header size: computed with placeholders first.
+        header.update({'ids_start': 0, 'offsets_start': 0, 'keys_start': 0})
+
+        header_size = len(json.dumps(header)) + 64
+
+        ids_start = len(self.magic) + 8 + header_size
+        ids_start += -ids_start % 8
+
+        offsets_start = ids_start + 8 * proteins
+        keys_start = offsets_start + 8 * (proteins + 1)
+
+        header.update({'ids_start': ids_start, 'offsets_start': offsets_start, 'keys_start': keys_start})
+
+        encoded_header = json.dumps(header).encode('utf-8')
+        encoded_header += b' ' * (ids_start - len(self.magic) - 8 - len(encoded_header))
+
+        temporary_file = self.snapshot_file + '.tmp'
+
+        with open(temporary_file, 'wb') as f:
+            f.write(self.magic)
+            f.write(struct.pack('<q', len(encoded_header)))
+            f.write(encoded_header)
+
+            self.write_ints(f, list(resolver.protein_ids))
+            self.write_ints(f, offsets)
+
+            for start in range(0, proteins, 65536):
+                f.write(b''.join(keys[start:start + 65536]))
+
+        # A snapshot already mapped by other loaders keeps working (it's another inode).
+        os.rename(temporary_file, self.snapshot_file)
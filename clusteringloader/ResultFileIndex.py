@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import fnmatch
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+
+class ResultFileIndex:
+    """
+    Index of the cluster result files (EC_<ec number>.fasta_<cluster>) of a directory.
+
+    The directory is read only once. For every result file the index keeps its EC number,
+    cluster suffix, path, size, modification time, validity and total of lines.
+
+    The index can be saved to a JSON file. Next time, the files with the same size and
+    modification time are not read again.
+
+    """
+
+    file_pattern = '*.fasta_*'
+
+    file_name_regex = re.compile('^EC_(.*)\.fasta_(.*)')
+
+    def __init__(self, source_data=None, index_file=None, validation='first-line'):
+
+        self.source_data = source_data
+
+        # Where to persist the index (None means no persistence).
+        self.index_file = index_file
+
+        # How the files were validated ('first-line' or 'strict'). A saved index is
+        # only reused if it was validated the same way.
+        self.validation = validation
+
+        # Result file path -> entry (dict).
+        self.entries = {}
+
+        # Result file paths, sorted.
+        self.paths = []
+
+    def directory_entries(self):
+        """
+        Return the name, path, size and modification time of the result files in the directory.
+
+        Paths are built the same way the loader does (source directory + '/' + file name).
+
+        Returns:
+            (generator): Tuples (name, path, size, mtime).
+
+        """
+
+        if scandir:
+            for entry in scandir(self.source_data):
+                if fnmatch.fnmatch(entry.name, self.file_pattern) and not entry.name.startswith('.'):
+                    stat = entry.stat()
+
+                    yield (entry.name, self.source_data + '/' + entry.name, stat.st_size, stat.st_mtime)
+
+        else:
+            for name in os.listdir(self.source_data):
+                if fnmatch.fnmatch(name, self.file_pattern) and not name.startswith('.'):
+                    path = self.source_data + '/' + name
+                    stat = os.stat(path)
+
+                    yield (name, path, stat.st_size, stat.st_mtime)
+
+    def count_lines(self, file_path=None):
+        """
+        Count the lines of a file exactly like iterating over it does (last line may have no line break).
+
+        Args:
+            file_path(str): Full path for the file.
+
+        Returns:
+            (int): Total of lines.
+
+        """
+
+        total_of_lines = 0
+        last_chunk = ''
+
+        with open(file_path, 'rb') as f:
+
+            while True:
+                chunk = f.read(1048576)
+
+                if not chunk:
+                    break
+
+                total_of_lines += chunk.count(b'\n')
+                last_chunk = chunk
+
+        if last_chunk and not last_chunk.endswith(b'\n'):
+            total_of_lines += 1
+
+        return total_of_lines
+
+    def load(self):
+        """
+        Read the previously saved index.
+
+        Returns:
+            (dict): Result file path -> entry. Empty if there's no saved index.
+
+        """
+
+        if not self.index_file or not os.path.exists(self.index_file):
+            return {}
+
+        try:
+            with open(self.index_file) as f:
+                saved = json.load(f)
+        except ValueError:
+            return {}
+
+        if saved.get('source_data') != self.source_data:
+            return {}
+
+        if saved.get('validation', 'first-line') != self.validation:
+            return {}
+
+        return saved.get('entries', {})
+
+    def save(self):
+        """
+        Save the index (atomically) to the index file.
+
+        Returns:
+            (boolean): True if it could be saved.
+
+        """
+
+        if not self.index_file:
+            return False
+
+        temporary_file = self.index_file + '.tmp'
+
+        try:
+            with open(temporary_file, 'w') as f:
+                json.dump({
+                    'source_data': self.source_data,
+                    'validation': self.validation,
+                    'entries': self.entries}, f)
+
+            os.rename(temporary_file, self.index_file)
+
+        except (IOError, OSError):
+            return False
+
+        return True
+
+    def build(self, validator=None, validate_files=None):
+        """
+        Read the directory and index every result file.
+
+        Args:
+            validator(function): Receives a file path and returns True if it's a valid result file.
+            validate_files(function): Receives a list of file paths and returns a report (dict
+                with 'valid', 'lines' and 'bad_lines') per path. Used instead of 'validator'.
+
+        """
+
+        previous = self.load()
+
+        entries = {}
+
+        # Files not indexed yet (or changed).
+        pending = []
+
+        for name, path, size, mtime in self.directory_entries():
+
+            entry = previous.get(path)
+
+            if entry and entry['size'] == size and entry['mtime'] == mtime:
+                entries[path] = entry
+                continue
+
+            ec_number = None
+            cluster = None
+
+            match = self.file_name_regex.search(name)
+
+            if match:
+                ec_number = match.group(1)
+                cluster = match.group(2)
+
+                pending.append(path)
+
+            entries[path] = {
+                'ec': ec_number,
+                'cluster': cluster,
+                'path': path,
+                'size': size,
+                'mtime': mtime,
+                'valid': False,
+                'lines': None,
+                'bad_lines': []}
+
+        if validate_files:
+            reports = validate_files(pending)
+        else:
+            reports = dict([(path, {'valid': validator(path), 'lines': None}) for path in pending])
+
+        for path in pending:
+            report = reports[path]
+            entry = entries[path]
+
+            entry['valid'] = report['valid']
+            entry['bad_lines'] = report.get('bad_lines', [])
+
+            if report['valid']:
+                entry['lines'] = report['lines']
+
+                if entry['lines'] is None:
+                    entry['lines'] = self.count_lines(path)
+
+        self.entries = entries
+        self.paths = sorted(entries)
+
+        self.save()
+
+    def files(self):
+        """
+        Return all the result files.
+
+        Returns:
+            (list): Result file paths.
+
+        """
+
+        return list(self.paths)
+
+    def valid_files(self):
+        """
+        Return the valid result files.
+
+        Returns:
+            (list): Valid result file paths.
+
+        """
+
+        return [path for path in self.paths if self.entries[path]['valid']]
+
+    def invalid_files(self):
+        """
+        Return the invalid result files.
+
+        Returns:
+            (list): Invalid result file paths.
+
+        """
+
+        return [path for path in self.paths if not self.entries[path]['valid']]
+
+    def bad_lines(self):
+        """
+        Return the line numbers that made result files invalid (strict validation only).
+
+        Returns:
+            (dict): Result file path -> bad line numbers (only the first ones of each file).
+
+        """
+
+        bad_lines = {}
+
+        for path in self.paths:
+            if self.entries[path].get('bad_lines'):
+                bad_lines[path] = self.entries[path]['bad_lines']
+
+        return bad_lines
+
+    def lines(self, file_path=None):
+        """
+        Return the total of lines of a valid result file.
+
+        Args:
+            file_path(str): Result file path.
+
+        Returns:
+            (int): Total of lines or None if the file isn't indexed as valid.
+
+        """
+
+        entry = self.entries.get(file_path)
+
+        if entry:
+            return entry['lines']
+
+    def total_lines(self):
+        """
+        Return the total of lines of all the valid result files.
+
+        Returns:
+            (int): Total of lines.
+
+        """
+
+        return sum([self.entries[path]['lines'] for path in self.valid_files()])
+
+    def size(self, file_path=None):
+        """
+        Return the size of an indexed result file.
+
+        Args:
+            file_path(str): Result file path.
+
+        Returns:
+            (int): File size or None if the file isn't indexed.
+
+        """
+
+        entry = self.entries.get(file_path)
+
+        if entry:
+            return entry['size']
+
+    def total_size(self):
+        """
+        Return the total size of all the valid result files.
+
+        Returns:
+            (int): Total of bytes.
+
+        """
+
+        return sum([self.entries[path]['size'] for path in self.valid_files()])
+
+    def ecs_and_clusters(self):
+        """
+        Return the EC numbers and its clusters (valid result files only).
+
+        Returns:
+            (dict): EC numbers and its cluster suffixes.
+
+        """
+
+        ecs_and_clusters = {}
+
+        for path in self.valid_files():
+            entry = self.entries[path]
+
+            ecs_and_clusters.setdefault(entry['ec'], []).append(entry['cluster'])
+
+        return ecs_and_clusters
@@ -0,0 +1,84 @@
+import collections
+from multiprocessing.pool import ThreadPool
+
+
+def read_result_file(file_path=None):
+    """
+    Read a whole result file.
+
+    Args:
+        file_path(str): Full path for the result file.
+
+    Returns:
+        (str): File contents.
+
+    """
+
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+class ResultFilePrefetcher:
+    """
+    Read the upcoming result files with a thread pool, while the current one is processed.
+
+    Files are returned in the given order. At most 'max_pending' files are read ahead, so
+    the memory stays capped. Opening and reading a file releases the GIL: on network
+    filesystems the open latency of many small files is paid in parallel.
+
+    """
+
+    def __init__(self, file_paths=None, threads=4, max_pending=64):
+
+        self.file_paths = file_paths
+
+        # No threads: files are read when they're needed.
+        self.threads = threads
+        self.max_pending = max(1, max_pending)
+
+        self.pool = None
+
+    def __iter__(self):
+
+        if self.threads <= 0:
+            for file_path in self.file_paths:
+                yield read_result_file(file_path)
+
+            return
+
+        self.pool = ThreadPool(processes=self.threads)
+
+        pending = collections.deque()
+
+        paths = iter(self.file_paths)
+
+        try:
+            for file_path in paths:
+                pending.append(self.pool.apply_async(read_result_file, (file_path,)))
+
+                if len(pending) >= self.max_pending:
+                    break
+
+            while pending:
+                data = pending.popleft().get()
+
+                file_path = next(paths, None)
+
+                if file_path is not None:
+                    pending.append(self.pool.apply_async(read_result_file, (file_path,)))
+
+                yield data
+
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Stop the reader threads.
+
+        """
+
+        if self.pool:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
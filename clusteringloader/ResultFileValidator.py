@@ -0,0 +1,131 @@
+import os
+import re
+import mmap
+import multiprocessing
+
+
+# Any line that is not exactly 'organism:gene' (a single ':' with something on both sides).
+bad_line_regex = re.compile(br'^(?![^:\r\n]+:[^:\r\n]+\r?$).*$', re.MULTILINE)
+
+# Keep only the first bad line numbers of each file (the total is always counted).
+max_reported_lines = 100
+
+
+def count_newlines(data=None, start=0, end=None, chunk_size=16777216):
+    """
+    Count the line breaks of a memory-mapped file region, chunk by chunk.
+
+    Args:
+        data(mmap): Memory-mapped file.
+        start(int): Region start.
+        end(int): Region end.
+        chunk_size(int): Bytes counted at once.
+
+    Returns:
+        (int): Total of line breaks.
+
+    """
+
+    total = 0
+
+    while start < end:
+        stop = min(start + chunk_size, end)
+        total += data[start:stop].count(b'\n')
+        start = stop
+
+    return total
+
+
+def scan_result_file(file_path=None):
+    """
+    Check every line of a cluster result file.
+
+    The file is memory-mapped and scanned by a compiled regular expression, so the
+    Python code only runs for the bad lines.
+
+    Args:
+        file_path(str): Full path for the result file.
+
+    Returns:
+        (dict): File path, validity, total of lines, first bad line numbers and total of bad lines.
+
+    """
+
+    size = os.path.getsize(file_path)
+
+    lines = 0
+    bad_lines = []
+    total_bad_lines = 0
+
+    if size > 0:
+
+        with open(file_path, 'rb') as f:
+
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            try:
+                line_number = 1
+                position = 0
+
+                for match in bad_line_regex.finditer(data):
+                    start = match.start()
+
+                    # Empty match after the last line break: there's no line there.
+                    if start == size:
+                        break
+
+                    line_number += count_newlines(data, position, start)
+                    position = start
+
+                    total_bad_lines += 1
+
+                    if len(bad_lines) < max_reported_lines:
+                        bad_lines.append(line_number)
+
+                lines = count_newlines(data, 0, size)
+
+                if data[size - 1:size] != b'\n':
+                    lines += 1
+
+            finally:
+                data.close()
+
+    return {
+        'file': file_path,
+        'valid': lines > 0 and total_bad_lines == 0,
+        'lines': lines,
+        'bad_lines': bad_lines,
+        'total_bad_lines': total_bad_lines}
+
+
+def validate_result_files(file_paths=None, workers=1):
+    """
+    Check every line of many cluster result files, using a process pool.
+
+    Args:
+        file_paths(list): Result file paths.
+        workers(int): Number of processes.
+
+    Returns:
+        (dict): Result file path -> report (see scan_result_file).
+
+    """
+
+    if workers <= 1 or len(file_paths) < 2:
+        reports = [scan_result_file(file_path) for file_path in file_paths]
+
+    else:
+        pool = multiprocessing.Pool(processes=workers)
+
+        try:
+            reports = pool.map(scan_result_file, file_paths, chunksize=64)
+            pool.close()
+
+        except Exception:
+            pool.terminate()
+            raise
+
+        finally:
+            pool.join()
+
+    return dict([(report['file'], report) for report in reports])
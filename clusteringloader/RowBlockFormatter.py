@@ -0,0 +1,329 @@
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class RowBlockFormatter:
+    """
+    Format all the 'clusters' rows of a result file at once (text or binary COPY format).
+
+    The rows of a file only differ in the id (consecutive, one per line) and the protein id:
+    identification, EC number id and clustering method id are the same. So the whole
+    block is serialized by a single formatting call instead of a few calls per row.
+
+    NumPy is used if installed: the ids, the masks and the whole block (text or binary)
+    are built by array operations, with no Python code per row. Otherwise the same block
+    is built by plain Python.
+
+    """
+
+    dtypes = {'int4': '>i4', 'int8': '>i8'}
+
+    def __init__(self, binary_writer=None, use_numpy=True):
+
+        # BinaryCopyWriter for the binary format, None for the text format.
+        self.binary_writer = binary_writer
+
+        self.numpy = numpy if use_numpy else None
+
+        self.binary_dtype = None
+
+        if self.binary_writer and self.numpy:
+            fields = [('count', '>i2')]
+
+            for position, column_type in enumerate(self.binary_writer.column_types):
+                fields.append(('length' + str(position), '>i4'))
+                fields.append(('value' + str(position), self.dtypes[column_type]))
+
+            self.binary_dtype = self.numpy.dtype(fields)
+
+        # Values below 10, 100, 1000... give the number of digits of the text format, and
+        # the digits are written two at a time ('00' to '99', as 2 bytes integers).
+        self.powers_of_ten = None
+        self.digit_pairs = None
+
+        if self.numpy:
+            self.powers_of_ten = self.numpy.array([10 ** exponent for exponent in range(1, 19)], dtype=self.numpy.int64)
+
+            self.digit_pairs = self.numpy.frombuffer(
+                ''.join(['%02d' % pair for pair in range(100)]).encode('ascii'), dtype=self.numpy.uint16)
+
+    def format(self, first_id=None, identification=None, ec_id=None, protein_ids=None, clustering_method_id=None):
+        """
+        Format the rows of a result file.
+
+        Args:
+            first_id(int): Cluster id of the first line (one id per line, resolved or not).
+            identification(int): Cluster identification.
+            ec_id(int): EC number database id.
+            protein_ids(list): Protein database id of each line (None if not found).
+            clustering_method_id(int): Clustering method database id.
+
+        Returns:
+            (tuple): Formatted rows (str) and total of rows.
+
+        """
+
+        if self.numpy is not None and protein_ids:
+            ids, proteins = self.numpy_columns(first_id, protein_ids)
+        else:
+            ids, proteins = self.python_columns(first_id, protein_ids)
+
+        rows = len(ids)
+
+        if not rows:
+            return b'', 0
+
+        if not self.binary_writer:
+            if self.numpy is not None and isinstance(ids, self.numpy.ndarray) and ids[0] >= 0 and proteins.min() >= 0:
+                return self.numpy_text_block(ids, proteins, identification, ec_id, clustering_method_id), rows
+
+            return self.text_block(ids, proteins, identification, ec_id, clustering_method_id), rows
+
+        # NULL values have a different layout.
+        if ec_id is None or clustering_method_id is None:
+            data = b''.join([
+                self.binary_writer.row([cluster_id, identification, ec_id, protein_id, clustering_method_id])
+                for cluster_id, protein_id in zip(ids, proteins)])
+
+            return data, rows
+
+        if self.binary_dtype is not None:
+            return self.numpy_binary_block(ids, proteins, identification, ec_id, clustering_method_id), rows
+
+        return self.python_binary_block(ids, proteins, identification, ec_id, clustering_method_id), rows
+
+    def numpy_columns(self, first_id=None, protein_ids=None):
+        """
+        Return the ids and protein ids of the resolved lines (NumPy).
+
+        Args:
+            first_id(int): Cluster id of the first line.
+            protein_ids(list): Protein database id of each line (None if not found).
+
+        Returns:
+            (tuple): Cluster ids and protein ids (NumPy arrays).
+
+        """
+
+        # Same rule of python_columns: a protein id that's not true (None, not resolved) is
+        # not written. The resolved ones are converted to exact int8 ids (no float).
+        values = self.numpy.array(protein_ids, dtype=object)
+
+        resolved = values.astype(bool)
+
+        ids = self.numpy.arange(first_id, first_id + len(protein_ids), dtype=self.numpy.int64)[resolved]
+        proteins = values[resolved].astype(self.numpy.int64)
+
+        return ids, proteins
+
+    def python_columns(self, first_id=None, protein_ids=None):
+        """
+        Return the ids and protein ids of the resolved lines (plain Python).
+
+        Args:
+            first_id(int): Cluster id of the first line.
+            protein_ids(list): Protein database id of each line (None if not found).
+
+        Returns:
+            (tuple): Cluster ids and protein ids (lists).
+
+        """
+
+        ids = []
+        proteins = []
+
+        cluster_id = first_id
+
+        for protein_id in protein_ids or []:
+            if protein_id:
+                ids.append(cluster_id)
+                proteins.append(protein_id)
+
+            cluster_id += 1
+
+        return ids, proteins
+
+    def interleave(self, ids=None, proteins=None):
+        """
+        Return the ids and protein ids interleaved (id, protein id, id, protein id...).
+
+        Args:
+            ids(list): Cluster ids.
+            proteins(list): Protein ids.
+
+        Returns:
+            (list): Interleaved values.
+
+        """
+
+        values = [0] * (2 * len(ids))
+        values[0::2] = ids
+        values[1::2] = proteins
+
+        return values
+
+    def text_block(self, ids=None, proteins=None, identification=None, ec_id=None, clustering_method_id=None):
+        """
+        Format the rows as tab separated values, by a single formatting operation.
+
+        Returns:
+            (str): Rows.
+
+        """
+
+        # Only the id and the protein id change from row to row.
+        row_template = '%d' + self.text_middle(identification, ec_id) + '%d' + self.text_end(clustering_method_id)
+
+        data = (row_template * len(ids)) % tuple(self.interleave(ids, proteins))
+
+        if not isinstance(data, bytes):
+            data = data.encode('ascii')
+
+        return data
+
+    def text_middle(self, identification=None, ec_id=None):
+        """
+        Return the text between the id and the protein id of every row (not resolved is NULL).
+
+        Returns:
+            (str): Tab separated identification and EC number id.
+
+        """
+
+        values = ['\\N' if value is None else str(value) for value in (identification, ec_id)]
+
+        return '\t' + '\t'.join(values) + '\t'
+
+    def text_end(self, clustering_method_id=None):
+        """
+        Return the text after the protein id of every row (not resolved is NULL).
+
+        Returns:
+            (str): Clustering method id and the line break.
+
+        """
+
+        return '\t' + ('\\N' if clustering_method_id is None else str(clustering_method_id)) + '\n'
+
+    def digit_columns(self, values=None):
+        """
+        Return the decimal digits of non-negative integers, right aligned: one row per value.
+
+        Args:
+            values(ndarray): Values (int8).
+
+        Returns:
+            (tuple): Digit characters (uint8, values x width) and the mask of the digits
+                that are written (the leading zeros of the alignment are not).
+
+        """
+
+        widths = self.numpy.searchsorted(self.powers_of_ten, values, side='right') + 1
+
+        # Even width: every column of the 2 bytes view gets a pair of digits.
+        width = int(widths.max()) + int(widths.max()) % 2
+
+        digits = self.numpy.empty((len(values), width), dtype=self.numpy.uint8)
+        pairs = digits.view(self.numpy.uint16)
+
+        for position in range(width // 2 - 1, -1, -1):
+            values, pair = self.numpy.divmod(values, 100)
+            pairs[:, position] = self.digit_pairs[pair]
+
+        return digits, self.numpy.arange(width) >= (width - widths)[:, None]
+
+    def numpy_text_block(self, ids=None, proteins=None, identification=None, ec_id=None, clustering_method_id=None):
+        """
+        Format the rows as tab separated values straight from the arrays (NumPy).
+
+        Every row is laid out in a byte matrix (id digits, constant middle, protein id
+        digits, constant end) and the alignment zeros are dropped by a single mask.
+
+        Returns:
+            (str): Rows, the same bytes of text_block.
+
+        """
+
+        middle = self.numpy.frombuffer(self.text_middle(identification, ec_id).encode('ascii'), dtype=self.numpy.uint8)
+        end = self.numpy.frombuffer(self.text_end(clustering_method_id).encode('ascii'), dtype=self.numpy.uint8)
+
+        id_digits, id_mask = self.digit_columns(ids)
+        protein_digits, protein_mask = self.digit_columns(proteins)
+
+        columns = [(id_digits, id_mask), (middle, None), (protein_digits, protein_mask), (end, None)]
+
+        block = self.numpy.empty((len(ids), sum([values.shape[-1] for values, mask in columns])), dtype=self.numpy.uint8)
+        written = self.numpy.ones(block.shape, dtype=bool)
+
+        start = 0
+
+        for values, mask in columns:
+            stop = start + values.shape[-1]
+
+            block[:, start:stop] = values
+
+            if mask is not None:
+                written[:, start:stop] = mask
+
+            start = stop
+
+        return block[written].tobytes()
+
+    def numpy_binary_block(self, ids=None, proteins=None, identification=None, ec_id=None, clustering_method_id=None):
+        """
+        Format the rows in the binary COPY format as a NumPy structured array.
+
+        Returns:
+            (str): Rows.
+
+        """
+
+        block = self.numpy.empty(len(ids), dtype=self.binary_dtype)
+
+        block['count'] = len(self.binary_writer.column_types)
+
+        for position, length in enumerate(self.binary_writer.lengths):
+            block['length' + str(position)] = length
+
+        block['value0'] = ids
+        block['value1'] = identification
+        block['value2'] = ec_id
+        block['value3'] = proteins
+        block['value4'] = clustering_method_id
+
+        return block.tobytes()
+
+    def python_binary_block(self, ids=None, proteins=None, identification=None, ec_id=None, clustering_method_id=None):
+        """
+        Format the rows in the binary COPY format by a single struct.pack call.
+
+        Returns:
+            (str): Rows.
+
+        """
+
+        lengths = self.binary_writer.lengths
+
+        values = []
+
+        columns = len(lengths)
+
+        for cluster_id, protein_id in zip(ids, proteins):
+            values.extend((
+                columns,
+                lengths[0], cluster_id,
+                lengths[1], identification,
+                lengths[2], ec_id,
+                lengths[3], protein_id,
+                lengths[4], clustering_method_id))
+
+        row_format = self.binary_writer.row_struct.format
+
+        if not isinstance(row_format, str):
+            row_format = row_format.decode('ascii')
+
+        return struct.pack('>' + row_format[1:] * len(ids), *values)
@@ -0,0 +1,124 @@
+from sqlalchemy import text
+
+
+class StagedLoad:
+    """
+    Load the rows of a clustering method (label) that may already be in the table.
+
+    The rows are loaded into an UNLOGGED staging table first (by any number of COPY
+    connections) and moved into the table by a single transaction:
+
+    - replace: every row of the clustering method is deleted (one DELETE statement) and
+      the staged rows are inserted. Readers see the old rows until the commit.
+    - merge: only the memberships (clustering_method_id, ec_id, protein_id) not found in
+      the table are inserted (anti-join). A new member of a cluster that's already loaded
+      gets the identification of that cluster.
+
+    """
+
+    modes = ['replace', 'merge']
+
+    columns = [
+        'id',
+        'identification',
+        'ec_id',
+        'protein_id',
+        'clustering_method_id']
+
+    def __init__(self, session=None, table='clusters', mode='replace', clustering_method_id=None):
+
+        self.session = session
+        self.table = table
+        self.mode = mode
+        self.clustering_method_id = clustering_method_id
+
+        # One staging table per clustering method, so different labels can be loaded at the same time.
+        self.staging_table = table + '_load_' + str(clustering_method_id)
+
+        # Rows deleted and inserted by apply().
+        self.deleted = 0
+        self.inserted = 0
+
+    def prepare(self):
+        """
+        Create the (empty) staging table, dropping the one left by a failed load.
+
+        """
+
+        self.session.execute(text('DROP TABLE IF EXISTS ' + self.staging_table))
+
+        # Only the columns (and NOT NULL): no indexes or constraints to slow down the COPY.
+        self.session.execute(text(
+            'CREATE UNLOGGED TABLE ' + self.staging_table + ' (LIKE ' + self.table + ' INCLUDING DEFAULTS)'))
+
+        self.session.commit()
+
+    def apply(self):
+        """
+        Move the staged rows into the table (single transaction) and drop the staging table.
+
+        Returns:
+            (tuple): Total of deleted and inserted rows.
+
+        """
+
+        columns = ', '.join(self.columns)
+        parameters = {'clustering_method_id': self.clustering_method_id}
+
+        try:
+            if self.mode == 'replace':
+                result = self.session.execute(text(
+                    'DELETE FROM ' + self.table + ' WHERE clustering_method_id = :clustering_method_id'),
+                    parameters)
+
+                self.deleted = result.rowcount
+
+                result = self.session.execute(text(
+                    'INSERT INTO ' + self.table + ' (' + columns + ') '
+                    'SELECT ' + columns + ' FROM ' + self.staging_table))
+
+                self.inserted = result.rowcount
+
+            else:
+                result = self.session.execute(text(
+                    'WITH existing AS ('
+                    'SELECT s.identification AS staged, min(t.identification) AS loaded '
+                    'FROM ' + self.staging_table + ' s '
+                    'JOIN ' + self.table + ' t '
+                    'ON t.clustering_method_id = s.clustering_method_id '
+                    'AND t.ec_id = s.ec_id '
+                    'AND t.protein_id = s.protein_id '
+                    'GROUP BY s.identification) '
+                    'INSERT INTO ' + self.table + ' (' + columns + ') '
+                    'SELECT s.id, coalesce(e.loaded, s.identification), s.ec_id, s.protein_id, s.clustering_method_id '
+                    'FROM ' + self.staging_table + ' s '
+                    'LEFT JOIN existing e ON e.staged = s.identification '
+                    'WHERE NOT EXISTS ('
+                    'SELECT 1 FROM ' + self.table + ' t '
+                    'WHERE t.clustering_method_id = s.clustering_method_id '
+                    'AND t.ec_id = s.ec_id '
+                    'AND t.protein_id = s.protein_id)'))
+
+                self.inserted = result.rowcount
+
+            self.session.execute(text('DROP TABLE ' + self.staging_table))
+
+            self.session.commit()
+
+        except Exception:
+            self.session.rollback()
+            raise
+
+        return self.deleted, self.inserted
+
+    def discard(self):
+        """
+        Drop the staging table (failed load): the table is left untouched.
+
+        """
+
+        self.session.rollback()
+
+        self.session.execute(text('DROP TABLE IF EXISTS ' + self.staging_table))
+
+        self.session.commit()
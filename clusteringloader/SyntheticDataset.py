@@ -0,0 +1,199 @@
+import os
+import random
+from sqlalchemy import Table, MetaData, Column, Integer
+from Basis import *
+from Organism import *
+from Protein import *
+from Ec import *
+from ClusteringMethod import *
+
+
+class SyntheticDataset:
+    """
+    Generate a synthetic clustering result (EC_<ec number>.fasta_<cluster> files and metadata file)
+    and the matching 'proteins' and 'ecs' records.
+
+    The number of clusters of each EC number follows a Pareto distribution (a few EC numbers
+    with many clusters, most of them with one or two), like the real results. Every result
+    file line is a protein ('ORGANISM:GENE'), except a few ones unknown by the database.
+
+    The same seed always generates the same dataset.
+
+    """
+
+    def __init__(
+            self,
+            directory=None,
+            ecs=1000,
+            cluster_skew=1.5,
+            max_clusters=100,
+            lines_per_file=50,
+            unknown_ratio=0.01,
+            organisms=500,
+            seed=1):
+
+        # Result files go to 'directory/results', metadata file is 'directory/metadata'.
+        self.directory = directory
+        self.source_data = directory + '/results'
+        self.metadata_file = directory + '/metadata'
+
+        self.ecs = ecs
+
+        # Pareto shape: the smaller, the more skewed (EC numbers with lots of clusters).
+        self.cluster_skew = cluster_skew
+        self.max_clusters = max_clusters
+
+        # Average of lines per result file (uniform from 1 to twice the average).
+        self.lines_per_file = lines_per_file
+
+        # Lines with proteins that don't exist in the database.
+        self.unknown_ratio = unknown_ratio
+
+        self.organisms = organisms
+
+        self.seed = seed
+
+        # Generated data: EC numbers and protein identifications (lower case, like the database).
+        self.ec_numbers = []
+        self.proteins = []
+
+        self.total_files = 0
+        self.total_lines = 0
+
+    def parameters(self):
+        """
+        Return the dataset parameters.
+
+        Returns:
+            (dict): Parameter name -> value.
+
+        """
+
+        return {
+            'ecs': self.ecs,
+            'cluster_skew': self.cluster_skew,
+            'max_clusters': self.max_clusters,
+            'lines_per_file': self.lines_per_file,
+            'unknown_ratio': self.unknown_ratio,
+            'organisms': self.organisms,
+            'seed': self.seed}
+
+    def generate_files(self):
+        """
+        Write the result files and the metadata file (any previous result file is removed).
+
+        """
+
+        generator = random.Random(self.seed)
+
+        if not os.path.exists(self.source_data):
+            os.makedirs(self.source_data)
+
+        for name in os.listdir(self.source_data):
+            if '.fasta_' in name:
+                os.remove(self.source_data + '/' + name)
+
+        self.ec_numbers = []
+        self.proteins = []
+
+        self.total_files = 0
+        self.total_lines = 0
+
+        gene = 0
+
+        for ec_index in range(self.ecs):
+
+            ec_number = '%d.%d.%d.%d' % (
+                ec_index % 6 + 1,
+                ec_index // 6 % 20 + 1,
+                ec_index // 120 % 30 + 1,
+                ec_index // 3600 + 1)
+
+            self.ec_numbers.append(ec_number)
+
+            clusters = min(self.max_clusters, int(generator.paretovariate(self.cluster_skew)))
+
+            for cluster in range(1, clusters + 1):
+
+                lines = []
+
+                for line in range(generator.randint(1, max(1, 2 * self.lines_per_file - 1))):
+                    gene += 1
+
+                    protein = 'org' + str(generator.randint(1, self.organisms)) + ':gene' + str(gene)
+
+                    if generator.random() < self.unknown_ratio:
+                        protein = 'unknown:gene' + str(gene)
+                    else:
+                        self.proteins.append(protein)
+
+                    lines.append(protein.upper())
+
+                with open(self.source_data + '/EC_' + ec_number + '.fasta_' + str(cluster), 'w') as f:
+                    f.write('\n'.join(lines) + '\n')
+
+                self.total_files += 1
+                self.total_lines += len(lines)
+
+        with open(self.metadata_file, 'w') as f:
+            f.write('author = synthetic\n')
+            f.write('label = synthetic-' + str(self.seed) + '\n')
+            f.write('date = 2000-01-01\n')
+            f.write('software = clusteringloader\n')
+
+    def create_tables(self, session=None):
+        """
+        Create the tables used by the loader if they don't exist (for an empty database, like SQLite).
+
+        Args:
+            session(Session): SQLAlchemy session.
+
+        """
+
+        engine = session.get_bind()
+
+        tables = ['organisms', 'proteins', 'ecs', 'protein_ecs', 'clustering_methods']
+
+        Base.metadata.create_all(engine, tables=[Base.metadata.tables[table] for table in tables])
+
+        # The 'clusters' model doesn't map every loaded column.
+        metadata = MetaData()
+
+        Table(
+            'clusters',
+            metadata,
+            Column('id', Integer, primary_key=True),
+            Column('identification', Integer),
+            Column('ec_id', Integer),
+            Column('protein_id', Integer),
+            Column('clustering_method_id', Integer))
+
+        metadata.create_all(engine)
+
+    def populate(self, session=None, chunk_size=10000):
+        """
+        Insert the generated proteins and EC numbers that don't exist yet in the database.
+
+        Args:
+            session(Session): SQLAlchemy session.
+            chunk_size(int): Records per insert statement.
+
+        """
+
+        self.create_tables(session)
+
+        existing = set([identification for (identification,) in session.query(Protein.identification)])
+
+        proteins = [{'identification': protein} for protein in self.proteins if protein not in existing]
+
+        for start in range(0, len(proteins), chunk_size):
+            session.execute(Protein.__table__.insert(), proteins[start:start + chunk_size])
+
+        existing = set([ec for (ec,) in session.query(Ec.ec)])
+
+        ecs = [{'ec': ec} for ec in self.ec_numbers if ec not in existing]
+
+        for start in range(0, len(ecs), chunk_size):
+            session.execute(Ec.__table__.insert(), ecs[start:start + chunk_size])
+
+        session.commit()
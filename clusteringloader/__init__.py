@@ -1,11 +1,21 @@
-__all__ = [ 'ClusteringLoader', 'Connection', 'Organism', 'Ec', 'ClusteringMethod', 'Protein' ]
+__all__ = [ 'ClusteringResults', 'ResultFileIndex', 'LogSystem', 'InsertManifest', 'CopyStream', 'PrefetchCopyStream', 'BinaryCopyWriter', 'InsertFile', 'GzipInsertFile', 'LoadMetrics', 'ResultFilePrefetcher', 'RowBlockFormatter', 'Benchmark' ]
 
 __docs__ = 'http://www.sitemaldito.com.br/clusteringloader/documentation'
 
 
-from ClusteringLoader import *
-from Organism import *
-from Ec import *
-from ClusteringMethod import *
-from Protein import *
-from Connection import *
+# Only the modules that don't need SQLAlchemy: reading and checking the result files
+# starts fast and runs without a database. The database classes (ClusteringLoader,
+# ClusteringBatch, Connection, the models...) are imported from their own modules:
+#
+#   from clusteringloader.ClusteringLoader import ClusteringLoader
+from ClusteringResults import *
+from ResultFileIndex import *
+from LogSystem import *
+from InsertManifest import *
+from CopyStream import *
+from BinaryCopyWriter import *
+from InsertFile import *
+from LoadMetrics import *
+from ResultFilePrefetcher import *
+from RowBlockFormatter import *
+from Benchmark import *
@@ -12,7 +12,7 @@ setup(
     description='Tool to import clustering results to AnEnDB relational database.',
     long_description='Tool to import clustering results to AnEnDB relational database.',
     packages=[ 'clusteringloader' ],
-    scripts=['bin/clusteringloader'],
+    scripts=['bin/clusteringloader', 'bin/clusteringloader-benchmark'],
     platforms='Linux',
     url='http://bioinfoteam.fiocruz.br/clusteringloader',
     install_requires=[